@@ -16,5 +16,14 @@ from .encoder import *
 from .crtc import *
 from .plane import *
 from .framebuffer import *
+from .framebufferpool import *
 from .resource_manager import *
 from .atomicreq import *
+from .atomictestcache import *
+from .swapchain import *
+from .aio import *
+from .framescheduler import *
+from .pacingstats import *
+from .commitqueue import *
+from .syncobj import *
+from .planebuffer import *
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+
+from typing import TYPE_CHECKING, AsyncIterator
+
+import kms
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'AsyncCard' ]
+
+class AsyncCard:
+    """asyncio integration for a Card
+
+    Reads the card's events when the card fd becomes readable, using
+    loop.add_reader(), so there is no cost when no events arrive. The events
+    are dispatched to the card's event handlers as with read_events(), and
+    can also be awaited with wait_flip() or iterated with events().
+
+    Use AsyncCard.get() to get the card's instance.
+    """
+    def __init__(self, card: Card, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self.card = card
+        self.loop = loop or asyncio.get_running_loop()
+
+        self._flip_waiters: dict[int, list[asyncio.Future[kms.DrmEvent]]] = {}
+        self._queues: list[asyncio.Queue[kms.DrmEvent]] = []
+
+        card.add_event_handler(self._handle_event)
+        self.loop.add_reader(card.fd, self._read_events)
+
+    @staticmethod
+    def get(card: Card) -> AsyncCard:
+        """Get the AsyncCard for the card, creating it for the running loop if needed"""
+        loop = asyncio.get_running_loop()
+
+        # E.g. a previous asyncio.run() on the same card
+        if card.aio and card.aio.loop is not loop:
+            card.aio.close()
+
+        if not card.aio:
+            card.aio = AsyncCard(card, loop)
+        return card.aio
+
+    def close(self):
+        self.loop.remove_reader(self.card.fd)
+        self.card.remove_event_handler(self._handle_event)
+
+        for waiters in self._flip_waiters.values():
+            for fut in waiters:
+                fut.cancel()
+        self._flip_waiters.clear()
+
+        if self.card.aio is self:
+            self.card.aio = None
+
+    def _read_events(self):
+        self.card.read_events()
+
+    def _handle_event(self, ev: kms.DrmEvent):
+        if ev.type == kms.DrmEventType.FLIP_COMPLETE:
+            waiters = self._flip_waiters.pop(ev.crtc_id, None)
+            if waiters:
+                for fut in waiters:
+                    if not fut.done():
+                        fut.set_result(ev)
+
+        for queue in self._queues:
+            queue.put_nowait(ev)
+
+    def wait_flip(self, crtc_id: int) -> asyncio.Future[kms.DrmEvent]:
+        """Get a future for the next FLIP_COMPLETE event of the crtc"""
+        fut = self.loop.create_future()
+        self._flip_waiters.setdefault(crtc_id, []).append(fut)
+        return fut
+
+    async def commit(self, req: kms.AtomicReq | kms.PreparedAtomicReq, allow_modeset = False) -> list[kms.DrmEvent]:
+        """Commit the request, and wait for the flips of all the affected crtcs"""
+        fut: asyncio.Future[list[kms.DrmEvent]] = self.loop.create_future()
+
+        def done(events: list[kms.DrmEvent]):
+            if not fut.done():
+                fut.set_result(events)
+
+        req.commit(allow_modeset, callback=done)
+
+        return await fut
+
+    async def wait_vblank(self, crtc: kms.Crtc, count=1) -> kms.DrmEvent:
+        """Wait until count vblanks have passed on the crtc
+
+        Returns the CRTC_SEQUENCE event.
+        """
+        fut: asyncio.Future[kms.DrmEvent] = self.loop.create_future()
+
+        def done(events: list[kms.DrmEvent]):
+            if not fut.done():
+                fut.set_result(events[0])
+
+        crtc.queue_sequence(count, callback=done)
+
+        return await fut
+
+    async def events(self) -> AsyncIterator[kms.DrmEvent]:
+        """Iterate over all the events of the card"""
+        queue: asyncio.Queue[kms.DrmEvent] = asyncio.Queue()
+        self._queues.append(queue)
+
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues.remove(queue)
@@ -1,119 +1,355 @@
 from __future__ import annotations
 
 import ctypes
+import errno
 import fcntl
 import itertools
 
+from typing import Callable
+
 import kms.uapi
 
-__all__ = [ 'AtomicReq' ]
+__all__ = [ 'AtomicReq', 'PreparedAtomicReq' ]
+
+class _AtomicBuffers:
+    """The ctypes buffers for DRM_IOCTL_MODE_ATOMIC, built from a sorted
+    list of (ob_id, prop_id, value)"""
+    def __init__(self, props: list[tuple[int, int, int]]) -> None:
+        objs = []
+        count_props = []
+
+        for ob_id, _, _ in props:
+            if objs and objs[-1] == ob_id:
+                count_props[-1] += 1
+            else:
+                objs.append(ob_id)
+                count_props.append(1)
+
+        num_obs = len(objs)
+        num_props = len(props)
+
+        self.objs = (kms.uapi.c_uint32 * num_obs)(*objs)
+        self.count_props = (kms.uapi.c_uint32 * num_obs)(*count_props)
+        self.prop_ids = (kms.uapi.c_uint32 * num_props)(*[p[1] for p in props])
+        self.prop_values = (kms.uapi.c_uint64 * num_props)(*[p[2] for p in props])
+
+        atomic = kms.uapi.struct_drm_mode_atomic()
+        atomic.count_objs = num_obs
+        atomic.objs_ptr = ctypes.addressof(self.objs)
+        atomic.count_props_ptr = ctypes.addressof(self.count_props)
+        atomic.props_ptr = ctypes.addressof(self.prop_ids)
+        atomic.prop_values_ptr = ctypes.addressof(self.prop_values)
+        self.atomic = atomic
+
+        # See committed_props()
+        self._committed_props: list[tuple[kms.DrmPropObject, list[int], list[int]]] | None = None
+
+    def committed_props(self, card: kms.Card) -> list[tuple[kms.DrmPropObject, list[int], list[int]]]:
+        """The properties whose cached values a commit updates, as (object,
+        prop IDs, value indices) per object. Volatile properties are left out."""
+        if self._committed_props is None:
+            committed: dict[int, tuple[kms.DrmPropObject, list[int], list[int]]] = {}
+
+            for idx, (ob_id, prop_id, _) in enumerate(self.iter_props()):
+                if card.find_property(prop_id).volatile:
+                    continue
+
+                if ob_id not in committed:
+                    committed[ob_id] = (card.get_prop_object(ob_id), [], [])
+
+                _, prop_ids, idxs = committed[ob_id]
+                prop_ids.append(prop_id)
+                idxs.append(idx)
+
+            self._committed_props = list(committed.values())
+
+        return self._committed_props
+
+    def ioctl(self, card: kms.Card, flags: int, user_data: int = 0):
+        self.atomic.flags = flags
+        self.atomic.user_data = user_data
+        fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_MODE_ATOMIC, self.atomic, True)
+
+        if flags & kms.uapi.DRM_MODE_ATOMIC_TEST_ONLY:
+            return
+
+        if flags & kms.uapi.DRM_MODE_ATOMIC_ALLOW_MODESET:
+            card.update_committed_props(self.iter_props(), modeset=True)
+            # A modeset may change what configurations are valid
+            card.atomic_test_cache.clear()
+            return
+
+        values = self.prop_values[:]
+        for ob, prop_ids, idxs in self.committed_props(card):
+            ob.update_committed_props(zip(prop_ids, [values[idx] for idx in idxs]))
+
+    def iter_props(self):
+        pidx = 0
+        for oidx, ob_id in enumerate(self.objs):
+            for _ in range(self.count_props[oidx]):
+                yield (ob_id, self.prop_ids[pidx], self.prop_values[pidx])
+                pidx += 1
+
+    def test(self, card: kms.Card, flags: int) -> bool:
+        try:
+            self.ioctl(card, flags | kms.uapi.DRM_MODE_ATOMIC_TEST_ONLY)
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ERANGE, errno.ENOSPC):
+                raise
+            return False
+
+        return True
+
+
+def _cached_test(card: kms.Card, props: list[tuple[int, int, int]], flags: int,
+                 get_bufs: Callable[[], _AtomicBuffers]) -> bool:
+    cache = card.atomic_test_cache
+    key = cache.key(props, flags)
+
+    result = cache.get(key)
+    if result is None:
+        result = get_bufs().test(card, flags)
+        cache.put(key, result)
+
+    return result
+
+
+def _sort_props(props: list[tuple[int, int, int]]):
+    # Sort the list by object ID, then by property ID
+    return sorted(props, key=lambda tuple: (tuple[0], tuple[1]))
+
+
+def _print_props(card: kms.Card, props: list[tuple[int, int, int]]):
+    for oid, g in itertools.groupby(props, lambda p: p[0]):
+        ob = card.get_object(oid)
+        print(ob)
+        for _, pid, val in g:
+            prop_name = card.find_property_name(pid)
+
+            if prop_name in ['SRC_X', 'SRC_Y', 'SRC_W', 'SRC_H']:
+                disp_val = f'{val / 0x10000} ({val})'
+            else:
+                disp_val = str(val)
+
+            print(f'  {prop_name}({pid}) = {disp_val}')
+
+
+def _drop_unchanged_props(card: kms.Card, props: list[tuple[int, int, int]]):
+    ret = []
+
+    for p in props:
+        ob_id, prop_id, value = p
+
+        ob = card.get_prop_object(ob_id)
+
+        if card.find_property(prop_id).volatile or \
+           ob.prop_values.get(prop_id) != value & 0xffffffffffffffff:
+            ret.append(p)
+
+    return ret
+
+
+def _affected_crtc_ids(card: kms.Card, props: list[tuple[int, int, int]]) -> set[int]:
+    crtc_ids = set()
+
+    for ob_id, prop_id, value in props:
+        ob = card.get_prop_object(ob_id)
+
+        if ob.type == kms.uapi.DRM_MODE_OBJECT_CRTC:
+            crtc_ids.add(ob_id)
+            continue
+
+        # Planes and connectors affect both the old and the new crtc
+        crtc_prop_id = ob.prop_ids_by_name.get('CRTC_ID')
+        if crtc_prop_id is None:
+            continue
+
+        old_crtc_id = ob.prop_values.get(crtc_prop_id, 0)
+        if old_crtc_id:
+            crtc_ids.add(old_crtc_id)
+
+        if prop_id == crtc_prop_id and value:
+            crtc_ids.add(value)
+
+    return crtc_ids
+
+
+def _commit_flags(allow_modeset: bool, nonblock: bool):
+    if nonblock:
+        flags = kms.uapi.DRM_MODE_PAGE_FLIP_EVENT | kms.uapi.DRM_MODE_ATOMIC_NONBLOCK
+    else:
+        flags = 0
+
+    if allow_modeset:
+        flags |= kms.uapi.DRM_MODE_ATOMIC_ALLOW_MODESET
+
+    return flags
+
+
+CommitCallback = Callable[[list['kms.DrmEvent']], None]
+
+
+def _commit_nonblocking(req: AtomicReq | PreparedAtomicReq, allow_modeset: bool,
+                        callback: CommitCallback | None, async_flip: bool) -> int:
+    card = req.card
+    token = card.new_commit_token()
+    flags = _commit_flags(allow_modeset, nonblock=True)
+
+    # Async flips cannot do modesets
+    if async_flip and not allow_modeset and card.supports_atomic_async_page_flip:
+        try:
+            req._commit(flags | kms.uapi.DRM_MODE_PAGE_FLIP_ASYNC, token, callback)
+            return token
+        except OSError as e:
+            # The driver can only do some commits asynchronously, e.g.
+            # ones that change only FB_ID. Fall back to a vsynced commit.
+            if e.errno != errno.EINVAL:
+                raise
+
+    req._commit(flags, token, callback)
+    return token
+
+
+def _commit_tracked(req: AtomicReq | PreparedAtomicReq,
+                    get_props: Callable[[], list[tuple[int, int, int]]],
+                    bufs: _AtomicBuffers, flags: int, user_data: int,
+                    callback: CommitCallback | None):
+    card = req.card
+
+    # Get the crtcs before the commit changes the state. The props are only
+    # needed for this, so they are not built for untracked commits.
+    crtc_ids: set[int] = set()
+    track = user_data and (callback or card.pacing_stats)
+    if track:
+        crtc_ids = _affected_crtc_ids(card, get_props())
+
+    for fence in req._out_fences.values():
+        fence.value = -1
+
+    bufs.ioctl(card, flags, user_data)
+
+    if track:
+        card.track_commit(user_data, crtc_ids, callback)
+
 
 class AtomicReq:
-    def __init__(self, card: kms.Card) -> None:
+    def __init__(self, card: kms.Card, delta = False) -> None:
         self.card = card
         self.props = [] # (ob_id, prop_id, value)
         self.debug_print = False
 
-    def commit(self, allow_modeset = False):
-        flags = kms.uapi.DRM_MODE_PAGE_FLIP_EVENT | kms.uapi.DRM_MODE_ATOMIC_NONBLOCK
+        # Blobs created for the request, kept alive until the commit
+        self._blobs: list[kms.Blob] = []
+
+        # The OUT_FENCE_PTR targets, keyed by crtc ID
+        self._out_fences: dict[int, ctypes.c_int32] = {}
+
+        # In delta mode the properties which already have the given value in
+        # the committed state are left out from the commit. If all the
+        # properties would be left out, the request is committed as is.
+        self.delta = delta
 
-        if allow_modeset:
-            flags |= kms.uapi.DRM_MODE_ATOMIC_ALLOW_MODESET
+    def commit(self, allow_modeset = False, callback: CommitCallback | None = None,
+               async_flip = False) -> int:
+        """Do a nonblocking commit
 
-        self._commit(flags)
+        Returns the commit's token, which the flip events have in their
+        data field. If callback is given, it is called from read_events()
+        with the flip events when all the affected crtcs have flipped.
+
+        If async_flip is set, the commit is done with DRM_MODE_PAGE_FLIP_ASYNC,
+        i.e. without waiting for vblank and possibly tearing. If the card or
+        the driver cannot do the commit asynchronously, it is done normally.
+        """
+        return _commit_nonblocking(self, allow_modeset, callback, async_flip)
 
     def commit_sync(self, allow_modeset = False):
-        flags = 0
+        self._commit(_commit_flags(allow_modeset, nonblock=False))
 
-        if allow_modeset:
-            flags |= kms.uapi.DRM_MODE_ATOMIC_ALLOW_MODESET
+    async def commit_async(self, allow_modeset = False) -> list[kms.DrmEvent]:
+        """Commit, and wait for the flip events of all the affected crtcs"""
+        return await kms.AsyncCard.get(self.card).commit(self, allow_modeset)
 
-        self._commit(flags)
+    def affected_crtc_ids(self) -> set[int]:
+        """The crtcs affected by the request, i.e. the ones that will send a flip event"""
+        return _affected_crtc_ids(self.card, self.props)
 
-    def _commit(self, flags):
-        # Sort the list by object ID, then by property ID
-        props = sorted(self.props, key=lambda tuple: (tuple[0], tuple[1]))
+    def _get_commit_props(self):
+        props = _sort_props(self.props)
 
-        if self.debug_print:
-            for oid, g in itertools.groupby(props, lambda p: p[0]):
-                ob = self.card.get_object(oid)
-                print(ob)
-                for _, pid, val in g:
-                    prop_name = self.card.find_property_name(pid)
+        if self.delta:
+            props = _drop_unchanged_props(self.card, props) or props
 
-                    if prop_name in ['SRC_X', 'SRC_Y', 'SRC_W', 'SRC_H']:
-                        disp_val = f'{val / 0x10000} ({val})'
-                    else:
-                        disp_val = str(val)
+        return props
 
-                    print(f'  {prop_name}({pid}) = {disp_val}')
+    def _commit(self, flags, user_data = 0, callback: CommitCallback | None = None):
+        props = self._get_commit_props()
 
-        obj_prop_counts = {}
-        for k, g in itertools.groupby(props, lambda p: p[0]):
-            obj_prop_counts[k] = len(list(g))
+        if self.debug_print:
+            _print_props(self.card, props)
 
-        num_obs = len(obj_prop_counts)
-        num_props = len(props)
+        _commit_tracked(self, lambda: props, _AtomicBuffers(props), flags, user_data, callback)
 
-        atomic = kms.uapi.struct_drm_mode_atomic()
+    def test(self, allow_modeset = False, use_cache = True) -> bool:
+        """Check if the request is valid with a TEST_ONLY commit
 
-        objs = (kms.uapi.c_uint32 * num_obs)()
-        count_props = (kms.uapi.c_uint32 * num_obs)()
-        prop_ids = (kms.uapi.c_uint32 * num_props)()
-        prop_values = (kms.uapi.c_uint64 * num_props)()
+        If use_cache is set, the result is looked up from, and stored to, the
+        card's atomic_test_cache.
+        """
+        props = self._get_commit_props()
 
-        for idx,ob_id in enumerate(sorted(obj_prop_counts)):
-            objs[idx] = ob_id
-            count_props[idx] = obj_prop_counts[ob_id]
+        if self.debug_print:
+            _print_props(self.card, props)
 
-        for idx,p in enumerate(props):
-            prop_id = p[1]
-            prop_value = p[2]
+        flags = _commit_flags(allow_modeset, nonblock=False)
 
-            prop_ids[idx] = prop_id
-            prop_values[idx] = prop_value
+        if use_cache:
+            return _cached_test(self.card, props, flags, lambda: _AtomicBuffers(props))
 
-        atomic.count_objs = num_obs
-        atomic.objs_ptr = ctypes.addressof(objs)
-        atomic.count_props_ptr = ctypes.addressof(count_props)
-        atomic.props_ptr = ctypes.addressof(prop_ids)
-        atomic.prop_values_ptr = ctypes.addressof(prop_values)
-        atomic.flags = flags
+        return _AtomicBuffers(props).test(self.card, flags)
 
-        pidx = 0
-        for oidx, oid in enumerate(objs):
-            prop_count = count_props[oidx]
+    def prepare(self) -> PreparedAtomicReq:
+        return PreparedAtomicReq(self)
 
-            for _ in range(prop_count):
-                prop_id = prop_ids[pidx]
-                prop_value = prop_values[pidx]
+    def _get_prop_object(self, ob: kms.DrmPropObject | int) -> kms.DrmPropObject:
+        if isinstance(ob, kms.DrmPropObject):
+            return ob
 
-                pidx += 1
+        if isinstance(ob, int):
+            return self.card.get_prop_object(ob)
 
-        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_MODE_ATOMIC, atomic, True)
+        raise RuntimeError('Bad object')
 
     def add_single(self, ob: kms.DrmPropObject | int, prop: str | int, value: int):
-        if isinstance(ob, int):
-            ob_id = ob
-            ob = self.card.get_object(ob_id)
-            assert(isinstance(ob, kms.DrmPropObject))
-        elif isinstance(ob, kms.DrmPropObject):
-            ob_id = ob.id
-        else:
-            raise RuntimeError('Bad object')
+        ob = self._get_prop_object(ob)
 
-        if isinstance(prop, int):
+        if isinstance(prop, str):
+            prop_id = ob.prop_ids_by_name[prop]
+        elif isinstance(prop, int):
             prop_id = prop
-        elif isinstance(prop, str):
-            prop_id = self.card.find_property_id(ob, prop)
         else:
             raise RuntimeError('Bad prop')
 
-        self.props.append((ob_id, prop_id, value))
+        self.props.append((ob.id, prop_id, value))
 
     def add_many(self, ob: kms.DrmPropObject | int, map: dict):
+        ob = self._get_prop_object(ob)
+
+        # Resolve the names through the object's name index directly, to avoid
+        # the per-property overhead of add_single()
+        prop_ids_by_name = ob.prop_ids_by_name
+        props = self.props
+        ob_id = ob.id
+
         for prop, value in map.items():
-            self.add_single(ob, prop, value)
+            if isinstance(prop, str):
+                prop_id = prop_ids_by_name[prop]
+            elif isinstance(prop, int):
+                prop_id = prop
+            else:
+                raise RuntimeError('Bad prop')
+
+            props.append((ob_id, prop_id, value))
 
     def add(self, ob: kms.DrmPropObject | int, *argv):
         if len(argv) == 2:
@@ -132,13 +368,65 @@ class AtomicReq:
         else:
             self.add(crtc.id, {'ACTIVE': 0, 'MODE_ID': 0})
 
+    def add_out_fence(self, crtc: kms.Crtc):
+        """Request an out fence for the crtc, signaled when the commit is shown
+
+        After a nonblocking commit, the sync_file fd is in out_fences. The
+        caller owns the fd and has to close it.
+        """
+        fence = ctypes.c_int32(-1)
+        self._out_fences[crtc.id] = fence
+        self.add(crtc, 'OUT_FENCE_PTR', ctypes.addressof(fence))
+
+    @property
+    def out_fences(self) -> dict[int, int]:
+        """The out fence fds of the last commit, keyed by crtc ID"""
+        return {crtc_id: fence.value for crtc_id, fence in self._out_fences.items()
+                if fence.value >= 0}
+
+    def add_mode(self, connector: kms.Connector, crtc: kms.Crtc, mode: kms.VideoMode) -> bool:
+        """Add the connector and crtc properties to set the mode
+
+        If the connector is already driven by the crtc with an identical mode,
+        e.g. set up by the firmware or a previous process, nothing is added
+        and the current mode is kept.
+
+        Returns True if a modeset is needed, i.e. the request has to be
+        committed with allow_modeset.
+        """
+        if crtc.is_mode_set(connector, mode):
+            return False
+
+        modeb = mode.to_blob(crtc.card)
+        self._blobs.append(modeb)
+
+        self.add_connector(connector, crtc)
+        self.add_crtc(crtc, modeb)
+
+        return True
+
     def add_plane(self, plane: kms.Plane,
                   fb: kms.Framebuffer | None,
                   crtc: kms.Crtc | None,
                   src: tuple[int, int, int, int] | None=None,
                   dst: tuple[int, int, int, int] | None=None,
                   zpos: int | None=None,
-                  params: dict | None=None):
+                  params: dict | None=None,
+                  in_fence_fd: int | None=None,
+                  damage: list[tuple[int, int, int, int]] | None=None):
+        """Add the plane properties to show the framebuffer
+
+        If in_fence_fd is given, the plane waits for the sync_file fence, e.g.
+        from the GPU rendering to the framebuffer, before using fb. The fd
+        is not closed.
+
+        damage is a list of (x, y, w, h) framebuffer regions which have
+        changed since the previous frame on the plane, and is sent as
+        FB_DAMAGE_CLIPS if the plane supports it. An empty list means the
+        whole plane is updated. If damage is None, the framebuffer's damage
+        is taken and used if fb is already on the plane, i.e. when updating
+        the content of the shown framebuffer.
+        """
         if not src and fb:
             src = (0, 0, fb.width, fb.height)
 
@@ -173,20 +461,144 @@ class AtomicReq:
         if zpos is not None:
             m['zpos'] = zpos
 
+        if in_fence_fd is not None:
+            m['IN_FENCE_FD'] = in_fence_fd
+
+        if fb and damage is None:
+            damage = fb.take_damage()
+
+            # The damage is relative to the previous frame, which only
+            # matches the framebuffer's own damage if it's already shown
+            if plane.prop_values.get(plane.prop_ids_by_name['FB_ID']) != fb.id:
+                damage = []
+
+        if damage and 'FB_DAMAGE_CLIPS' in plane.prop_ids_by_name:
+            blob = AtomicReq.damage_blob(self.card, damage)
+            self._blobs.append(blob)
+            m['FB_DAMAGE_CLIPS'] = blob.id
+
         if params:
             m.update(params)
 
         self.add(plane, m)
 
     @staticmethod
-    def set_mode(connector, crtc, fb, mode):
-        modeb = mode.to_blob(crtc.card)
+    def damage_blob(card: kms.Card, damage: list[tuple[int, int, int, int]]) -> kms.Blob:
+        """Get a FB_DAMAGE_CLIPS blob for a list of (x, y, w, h) rects"""
+        rects = (kms.uapi.drm_mode_rect * len(damage))(
+            *[(x, y, x + w, y + h) for x, y, w, h in damage])
+
+        # Repeating damage, e.g. from animations, shares the blobs
+        return card.blob_cache.get(rects)
+
+    @staticmethod
+    def set_mode(connector, crtc, fb, mode, takeover = True) -> bool:
+        """Set the mode and show fb on the crtc's first plane
+
+        With takeover, an identical mode which is already set is kept and only
+        the plane is updated. Returns True if a modeset was done.
+        """
         plane = crtc.get_possible_planes()[0]
 
         req = kms.AtomicReq(crtc.card)
 
-        req.add_connector(connector, crtc)
-        req.add_crtc(crtc, modeb)
+        if takeover:
+            modeset = req.add_mode(connector, crtc, mode)
+        else:
+            modeb = mode.to_blob(crtc.card)
+            req.add_connector(connector, crtc)
+            req.add_crtc(crtc, modeb)
+            modeset = True
+
         req.add_plane(plane, fb, crtc, dst=(0, 0, mode.hdisplay, mode.vdisplay))
 
-        req.commit_sync(allow_modeset = True)
+        req.commit_sync(allow_modeset = modeset)
+
+        return modeset
+
+
+class PreparedAtomicReq:
+    """An atomic request with a fixed set of objects and properties
+
+    The ioctl buffers are built once, and only the property values can be
+    changed between commits. This is meant for flip loops, where the same
+    properties (e.g. FB_ID) are set for every frame:
+
+        req = kms.AtomicReq(card)
+        req.add(plane, 'FB_ID', fbs[0].id)
+        prep = req.prepare()
+        fb_id_idx = prep.index(plane, 'FB_ID')
+        ...
+        prep.values[fb_id_idx] = fbs[1].id
+        prep.commit()
+    """
+    def __init__(self, req: AtomicReq) -> None:
+        self.card = req.card
+        self.debug_print = req.debug_print
+
+        # Drop duplicate entries, the last one wins as it would with the kernel
+        props = _sort_props(list({(p[0], p[1]): p for p in req.props}.values()))
+
+        self._indices = {(p[0], p[1]): idx for idx, p in enumerate(props)}
+        self._bufs = _AtomicBuffers(props)
+
+        # The ctypes array of the property values. Can be modified directly.
+        self.values = self._bufs.prop_values
+
+        # Look up the objects and properties once, so that a commit only
+        # copies the committed values to the cached ones
+        self._bufs.committed_props(self.card)
+
+        # The OUT_FENCE_PTR values point to these
+        self._out_fences = req._out_fences
+
+        # Keep the blobs, e.g. the damage clips, alive with the prepared request
+        self._blobs = req._blobs
+
+    def index(self, ob: kms.DrmPropObject | int, prop: str | int) -> int:
+        if isinstance(ob, int):
+            ob = self.card.get_prop_object(ob)
+
+        prop_id = ob.prop_ids_by_name[prop] if isinstance(prop, str) else prop
+
+        return self._indices[(ob.id, prop_id)]
+
+    def set(self, ob: kms.DrmPropObject | int, prop: str | int, value: int):
+        self.values[self.index(ob, prop)] = value
+
+    @property
+    def out_fences(self) -> dict[int, int]:
+        """The out fence fds of the last commit, see AtomicReq.add_out_fence()"""
+        return {crtc_id: fence.value for crtc_id, fence in self._out_fences.items()
+                if fence.value >= 0}
+
+    def commit(self, allow_modeset = False, callback: CommitCallback | None = None,
+               async_flip = False) -> int:
+        """Do a nonblocking commit, see AtomicReq.commit()"""
+        return _commit_nonblocking(self, allow_modeset, callback, async_flip)
+
+    def commit_sync(self, allow_modeset = False):
+        self._commit(_commit_flags(allow_modeset, nonblock=False))
+
+    def affected_crtc_ids(self) -> set[int]:
+        return _affected_crtc_ids(self.card, self.props)
+
+    def test(self, allow_modeset = False, use_cache = True) -> bool:
+        """Check if the request is valid with a TEST_ONLY commit"""
+        flags = _commit_flags(allow_modeset, nonblock=False)
+
+        if use_cache:
+            return _cached_test(self.card, self.props, flags, lambda: self._bufs)
+
+        return self._bufs.test(self.card, flags)
+
+    def _commit(self, flags, user_data = 0, callback: CommitCallback | None = None):
+        if self.debug_print:
+            _print_props(self.card, self.props)
+
+        _commit_tracked(self, lambda: self.props, self._bufs, flags, user_data, callback)
+
+    @property
+    def props(self) -> list[tuple[int, int, int]]:
+        return [(ob_id, prop_id, int(self.values[idx]))
+                for (ob_id, prop_id), idx in self._indices.items()]
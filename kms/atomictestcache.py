@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'AtomicTestCache' ]
+
+class AtomicTestCache:
+    """Memoized results of TEST_ONLY atomic commits
+
+    The results are keyed by the (object, property, value) set of the
+    request. FB_ID values are replaced with the size, format and modifier of
+    the framebuffer, so that the same configuration with a different
+    framebuffer is a cache hit. Likewise IN_FENCE_FD and OUT_FENCE_PTR
+    values only tell if a fence is used.
+
+    The validity of a configuration may depend on the current state of the
+    other objects, so the cache is cleared on every modeset commit. Call
+    clear() if the state changes in some other way that may affect the
+    results.
+    """
+    def __init__(self, card: Card, max_entries=1024) -> None:
+        self.card = card
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._results: OrderedDict[tuple, bool] = OrderedDict()
+        # Property ID -> the key function for the property's values, or None
+        self._value_keys: dict[int, Callable[[int], object] | None] = {}
+
+    def _value_key(self, prop_id: int):
+        try:
+            return self._value_keys[prop_id]
+        except KeyError:
+            pass
+
+        name = self.card.find_property_name(prop_id)
+
+        if name == 'FB_ID':
+            value_key = self._fb_key
+        elif name in ('IN_FENCE_FD', 'OUT_FENCE_PTR'):
+            value_key = AtomicTestCache._fence_key
+        elif name == 'FB_DAMAGE_CLIPS':
+            value_key = AtomicTestCache._damage_key
+        else:
+            value_key = None
+
+        self._value_keys[prop_id] = value_key
+        return value_key
+
+    @staticmethod
+    def _fence_key(value: int):
+        # IN_FENCE_FD is -1 and OUT_FENCE_PTR 0 when not used
+        return ('fence', value not in (0, -1, 0xffffffffffffffff))
+
+    @staticmethod
+    def _damage_key(blob_id: int):
+        # The damage blobs change every frame, only their use matters
+        return ('damage', blob_id != 0)
+
+    def _fb_key(self, fb_id: int):
+        if fb_id == 0:
+            return 0
+
+        fb = self.card.find_framebuffer(fb_id)
+        if not fb:
+            # Unknown framebuffer, we have to use the ID
+            return ('fb', fb_id)
+
+        return ('fb', fb.width, fb.height, fb.format.drm_fourcc, fb.modifier)
+
+    def key(self, props: list[tuple[int, int, int]], flags: int) -> tuple:
+        """Canonical key for a sorted list of (ob_id, prop_id, value)"""
+        return (flags, tuple((ob_id, prop_id, self._key_value(prop_id, value))
+                             for ob_id, prop_id, value in props))
+
+    def _key_value(self, prop_id: int, value: int):
+        value_key = self._value_key(prop_id)
+        return value_key(value) if value_key else value
+
+    def get(self, key: tuple) -> bool | None:
+        result = self._results.get(key)
+
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._results.move_to_end(key)
+
+        return result
+
+    def put(self, key: tuple, result: bool):
+        self._results[key] = result
+        self._results.move_to_end(key)
+
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
+
+    def __len__(self):
+        return len(self._results)
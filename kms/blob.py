@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 import ctypes
 import fcntl
 import weakref
@@ -12,7 +13,7 @@ import kms.uapi
 if TYPE_CHECKING:
     from kms import Card
 
-__all__ = [ 'Blob' ]
+__all__ = [ 'Blob', 'BlobCache' ]
 
 class Blob(kms.DrmObject):
     def __init__(self, card: Card, data) -> None:
@@ -34,3 +35,53 @@ class Blob(kms.DrmObject):
 
     def __repr__(self) -> str:
         return f'Blob({self.id})'
+
+
+class BlobCache:
+    """Property blobs shared by their content
+
+    Returns the same Blob, and thus the same kernel blob ID, for identical
+    payloads. The Blobs are reference counted by Python: the cache keeps
+    references to the max_entries most recently used blobs, and a blob is
+    destroyed when the cache and all the users have dropped it. A blob
+    which is evicted but still in use is still returned for its payload.
+    """
+    def __init__(self, card: Card, max_entries=32) -> None:
+        self.card = card
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._recent: OrderedDict[bytes, Blob] = OrderedDict()
+        self._all: weakref.WeakValueDictionary[bytes, Blob] = weakref.WeakValueDictionary()
+
+    def get(self, data) -> Blob:
+        """Get a blob for a ctypes object or a bytes-like object"""
+        key = bytes(data)
+
+        blob = self._all.get(key)
+
+        if blob:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+            if not isinstance(data, (ctypes.Array, ctypes.Structure, ctypes.Union)):
+                data = (ctypes.c_char * len(key)).from_buffer_copy(key)
+
+            blob = Blob(self.card, data)
+            self._all[key] = blob
+
+        self._recent[key] = blob
+        self._recent.move_to_end(key)
+
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+        return blob
+
+    def clear(self):
+        """Drop the cache's references to the blobs"""
+        self._recent.clear()
+
+    def __len__(self):
+        return len(self._all)
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
 import ctypes
+import errno
 import fcntl
 import glob
 import io
 import os
+import time
 import weakref
 
-from kms.drmevent import DrmEvent, DrmEventType
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from kms.atomictestcache import AtomicTestCache
+from kms.blob import BlobCache
+from kms.drmevent import DrmEvent, DrmEventType, decode_events
+from kms.drmobject import DrmObject
 from kms.drmproperty import DrmProperty
 from kms.drmpropobject import DrmPropObject
 from kms.connector import Connector
@@ -15,30 +22,114 @@ from kms.encoder import Encoder
 from kms.crtc import Crtc
 from kms.plane import Plane
 from kms.framebuffer import Framebuffer
+from kms.framebufferpool import FramebufferPool
+from kms.pacingstats import PacingStats
 
 import kms.uapi
 
+if TYPE_CHECKING:
+    from kms.aio import AsyncCard
+
 __all__ = [
     'Card',
 ]
 
+class _LazyObjectList:
+    """KMS objects of one type, created on first access"""
+    def __init__(self, card: Card, cls, type: int, ids: list[int],
+                 registry: dict[int, DrmObject]) -> None:
+        self.card = card
+        self.registry = registry
+        self.cls = cls
+        self.type = type
+        self.ids = ids
+        self.idxs = {id: idx for idx, id in enumerate(ids)}
+        self.obs: list = [None] * len(ids)
+        self.all: list | None = None
+
+    def get(self, idx: int):
+        ob = self.obs[idx]
+        if not ob:
+            ob = self.cls(self.card, self.ids[idx], idx)
+            self.obs[idx] = ob
+            self.registry[ob.id] = ob
+        return ob
+
+    def get_by_id(self, id: int):
+        return self.get(self.idxs[id])
+
+    def get_all(self) -> list:
+        if self.all is None:
+            self.all = [self.get(idx) for idx in range(len(self.ids))]
+        return self.all
+
+class _PendingCommit:
+    def __init__(self, crtc_ids: set[int], callback: Callable[[list[DrmEvent]], None]) -> None:
+        self.crtc_ids = crtc_ids
+        self.callback = callback
+        self.events: list[DrmEvent] = []
+
+
 class Card:
-    def __init__(self, dev_path: str | None = None) -> None:
+    def __init__(self, dev_path: str | None = None, lazy=False) -> None:
         if not dev_path:
             dev_path = Card.__open_first_kms_device()
 
         self.dev_path = dev_path
 
+        # In lazy mode only the object ID lists are fetched at init time. The
+        # KMS objects, their property values and the DrmProperty objects are
+        # created on first access.
+        self.lazy = lazy
+
         self.fio = io.FileIO(dev_path,
                              opener=lambda name,_: os.open(name, os.O_RDWR | os.O_NONBLOCK))
 
+        self._props: dict[int, DrmProperty] = {}
+
+        # Object registry. _objects contains the created objects, keyed by
+        # object ID. _object_lists contains all known objects, created or not,
+        # keyed by object ID and by object type.
+        self._objects: dict[int, DrmObject] = {}
+        self._object_lists: dict[int, _LazyObjectList] = {}
+        self._object_lists_by_type: dict[int, _LazyObjectList] = {}
+
+        # Framebuffers created for this card, keyed by framebuffer ID
+        self._framebuffers: weakref.WeakValueDictionary[int, Framebuffer] = weakref.WeakValueDictionary()
+
+        self.atomic_test_cache = AtomicTestCache(self)
+        self.blob_cache = BlobCache(self)
+        self.fb_pool = FramebufferPool(self)
+
         self.set_defaults()
         self.get_res()
         self.get_plane_res()
-        self.collect_props()
+
+        if not lazy:
+            self.collect_props()
 
         self.event_buf = bytearray(1024)
 
+        self._event_handlers: list[Callable[[DrmEvent], None]] = []
+        self._crtc_event_handlers: dict[int, list[Callable[[DrmEvent], None]]] = {}
+
+        # Created on first async use
+        self.aio: AsyncCard | None = None
+
+        # Capabilities, read on first use, see get_cap()
+        self._caps: dict[int, int] = {}
+
+        # Nonblocking commit tokens and callbacks, see AtomicReq.commit()
+        self._next_commit_token = 1
+        self._commit_callbacks: dict[int, _PendingCommit] = {}
+
+        # kms.PacingStats, see enable_pacing_stats()
+        self.pacing_stats: PacingStats | None = None
+
+        # CRTC_SEQUENCE events do not tell the crtc. Crtc.queue_sequence()
+        # uses a commit token as the user_data, see register_sequence().
+        self._sequence_crtc_ids: dict[int, int] = {}
+
         weakref.finalize(self, self.fio.close)
 
     @staticmethod
@@ -73,23 +164,40 @@ class Card:
             for prop_id in ob.prop_values:
                 prop_ids.add(prop_id)
 
-        props = {}
-
         for prop_id in prop_ids:
-            prop = DrmProperty(self, prop_id)
-            props[prop_id] = prop
-
-        self._props: dict[int, DrmProperty] = props
+            self.find_property(prop_id)
 
-    def find_property(self, prop_id: int):
-        return self._props[prop_id]
+    def find_property(self, prop_id: int) -> DrmProperty:
+        prop = self._props.get(prop_id)
+        if not prop:
+            prop = DrmProperty(self, prop_id)
+            self._props[prop_id] = prop
+        return prop
 
     def find_property_id(self, obj: DrmPropObject, prop_name: str):
-        # We may have duplicate names
-        return next(id for id in obj.prop_values if self._props[id].name == prop_name)
+        return obj.get_prop_id(prop_name)
 
     def find_property_name(self, prop_id):
-        return self._props[prop_id].name
+        return self.find_property(prop_id).name
+
+    def update_committed_props(self, props: Iterable[tuple[int, int, int]], modeset: bool):
+        """Update the objects' cached property values after a successful commit
+
+        A modeset may change other properties than the ones committed, so
+        for modesets the cached values of the committed objects are dropped
+        instead, and re-read on next use.
+        """
+        objects = self._objects
+
+        for ob_id, prop_id, value in props:
+            ob = objects.get(ob_id)
+            if not isinstance(ob, DrmPropObject):
+                continue
+
+            if modeset:
+                ob.invalidate_props()
+            elif not self.find_property(prop_id).volatile:
+                ob.update_committed_prop(prop_id, value)
 
     def set_defaults(self):
         try:
@@ -113,6 +221,75 @@ class Card:
         if not cap.value:
             raise NotImplementedError('Card does not support atomic modesetting')
 
+    def get_cap(self, capability: int) -> int:
+        """Get a capability of the card
+
+        The capabilities do not change, so the values are cached. Returns 0
+        for capabilities unknown to the kernel.
+        """
+        value = self._caps.get(capability)
+        if value is None:
+            cap = kms.uapi.drm_get_cap(capability)
+            try:
+                fcntl.ioctl(self.fd, kms.uapi.DRM_IOCTL_GET_CAP, cap, True)
+                value = cap.value
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                value = 0
+            self._caps[capability] = value
+        return value
+
+    @property
+    def timestamp_monotonic(self) -> bool:
+        """Are the vblank and flip timestamps in CLOCK_MONOTONIC
+
+        If not, they are in CLOCK_REALTIME.
+        """
+        return bool(self.get_cap(kms.uapi.DRM_CAP_TIMESTAMP_MONOTONIC))
+
+    @property
+    def supports_async_page_flip(self) -> bool:
+        """Can legacy page flips be done with DRM_MODE_PAGE_FLIP_ASYNC"""
+        return bool(self.get_cap(kms.uapi.DRM_CAP_ASYNC_PAGE_FLIP))
+
+    @property
+    def supports_atomic_async_page_flip(self) -> bool:
+        """Can atomic commits be done with DRM_MODE_PAGE_FLIP_ASYNC"""
+        return bool(self.get_cap(kms.uapi.DRM_CAP_ATOMIC_ASYNC_PAGE_FLIP))
+
+    @property
+    def supports_page_flip_target(self) -> bool:
+        """Can legacy page flips be given a target vblank"""
+        return bool(self.get_cap(kms.uapi.DRM_CAP_PAGE_FLIP_TARGET))
+
+    @property
+    def timestamp_clock(self) -> int:
+        """The clock of the vblank and flip timestamps, time.CLOCK_MONOTONIC or time.CLOCK_REALTIME"""
+        return time.CLOCK_MONOTONIC if self.timestamp_monotonic else time.CLOCK_REALTIME
+
+    def _realtime_offset_ns(self) -> int:
+        # Sampled on each use, as CLOCK_REALTIME can be stepped
+        return time.clock_gettime_ns(time.CLOCK_REALTIME) - time.monotonic_ns()
+
+    def to_monotonic_ns(self, time_ns: int) -> int:
+        """Convert a vblank or flip timestamp to the time.monotonic_ns() clock"""
+        if self.timestamp_monotonic:
+            return time_ns
+        return time_ns - self._realtime_offset_ns()
+
+    def from_monotonic_ns(self, time_ns: int) -> int:
+        """Convert a time.monotonic_ns() time to the vblank and flip timestamp clock"""
+        if self.timestamp_monotonic:
+            return time_ns
+        return time_ns + self._realtime_offset_ns()
+
+    def event_time_monotonic_ns(self, ev: DrmEvent) -> int:
+        """Get the event's timestamp in the time.monotonic_ns() clock"""
+        if ev.type == DrmEventType.CRTC_SEQUENCE:
+            return ev.time_ns
+        return self.to_monotonic_ns(ev.time_ns)
+
     def get_version(self):
         ver = kms.uapi.drm_version()
         fcntl.ioctl(self.fd, kms.uapi.DRM_IOCTL_VERSION, ver, True)
@@ -143,9 +320,14 @@ class Card:
 
         fcntl.ioctl(self.fd, kms.uapi.DRM_IOCTL_MODE_GETRESOURCES, res, True)
 
-        self.crtcs = [Crtc(self, id, idx) for idx,id in enumerate(crtc_ids)]
-        self.connectors = [Connector(self, id, idx) for idx,id in enumerate(connector_ids)]
-        self.encoders = [Encoder(self, id, idx) for idx,id in enumerate(encoder_ids)]
+        self._crtcs = self.__register_objects(Crtc, kms.uapi.DRM_MODE_OBJECT_CRTC, crtc_ids)
+        self._connectors = self.__register_objects(Connector, kms.uapi.DRM_MODE_OBJECT_CONNECTOR, connector_ids)
+        self._encoders = self.__register_objects(Encoder, kms.uapi.DRM_MODE_OBJECT_ENCODER, encoder_ids)
+
+        if not self.lazy:
+            self._crtcs.get_all()
+            self._connectors.get_all()
+            self._encoders.get_all()
 
     def get_plane_res(self):
         res = kms.uapi.drm_mode_get_plane_res()
@@ -156,19 +338,77 @@ class Card:
 
         fcntl.ioctl(self.fd, kms.uapi.DRM_IOCTL_MODE_GETPLANERESOURCES, res, True)
 
-        self.planes = [Plane(self, id, idx) for idx,id in enumerate(plane_ids)]
+        self._planes = self.__register_objects(Plane, kms.uapi.DRM_MODE_OBJECT_PLANE, plane_ids)
+
+        if not self.lazy:
+            self._planes.get_all()
+
+    def __register_objects(self, cls, type: int, ids) -> _LazyObjectList:
+        # Drop the previous objects of this type, if we are refreshing
+        old = self._object_lists_by_type.get(type)
+        if old:
+            for id in old.ids:
+                self._objects.pop(id, None)
+                del self._object_lists[id]
+
+        obs = _LazyObjectList(self, cls, type, list(ids), self._objects)
+
+        self._object_lists_by_type[type] = obs
+        for id in obs.ids:
+            self._object_lists[id] = obs
+
+        return obs
+
+    @property
+    def crtcs(self) -> list[Crtc]:
+        return self._crtcs.get_all()
+
+    @property
+    def connectors(self) -> list[Connector]:
+        return self._connectors.get_all()
+
+    @property
+    def encoders(self) -> list[Encoder]:
+        return self._encoders.get_all()
+
+    @property
+    def planes(self) -> list[Plane]:
+        return self._planes.get_all()
+
+    def get_object(self, id: int, type: int | None = None):
+        ob = self._objects.get(id)
+        if not ob:
+            ob = self._object_lists[id].get_by_id(id)
+
+        if type is not None and ob.type != type:
+            raise KeyError(id)
 
-    def get_object(self, id):
-        return next(ob for ob in [*self.crtcs, *self.connectors, *self.encoders, *self.planes] if ob.id == id)
+        return ob
+
+    def get_prop_object(self, id: int) -> DrmPropObject:
+        """Get an object with properties, e.g. a crtc, connector or plane"""
+        ob = self.get_object(id)
+        if not isinstance(ob, DrmPropObject):
+            raise KeyError(id)
+        return ob
 
     def get_connector(self, id):
-        return next(ob for ob in self.connectors if ob.id == id)
+        return self._connectors.get_by_id(id)
 
     def get_crtc(self, id):
-        return next(ob for ob in self.crtcs if ob.id == id)
+        return self._crtcs.get_by_id(id)
 
     def get_encoder(self, id):
-        return next(ob for ob in self.encoders if ob.id == id)
+        return self._encoders.get_by_id(id)
+
+    def get_plane(self, id):
+        return self._planes.get_by_id(id)
+
+    def register_framebuffer(self, fb: Framebuffer):
+        self._framebuffers[fb.id] = fb
+
+    def find_framebuffer(self, id: int) -> Framebuffer | None:
+        return self._framebuffers.get(id)
 
     def get_framebuffer(self, id):
         res = kms.uapi.drm_mode_fb_cmd2()
@@ -185,42 +425,136 @@ class Card:
             p.offset = res.offsets[i]
             planes.append(p)
 
-        return Framebuffer(self, res.fb_id, res.width, res.height, format, planes)
+        modifier = res.modifier[0] if res.flags & kms.uapi.DRM_MODE_FB_MODIFIERS else 0
+
+        return Framebuffer(self, res.fb_id, res.width, res.height, format, planes, modifier)
+
+    def add_event_handler(self, handler: Callable[[DrmEvent], None], crtc: Crtc | None = None):
+        """Add a handler which is called for the events from read_events()
+
+        If crtc is given, the handler is called only for the events of that
+        crtc. Otherwise the handler is called for all events.
+        """
+        if crtc:
+            self._crtc_event_handlers.setdefault(crtc.id, []).append(handler)
+        else:
+            self._event_handlers.append(handler)
+
+    def remove_event_handler(self, handler: Callable[[DrmEvent], None], crtc: Crtc | None = None):
+        if crtc:
+            handlers = self._crtc_event_handlers[crtc.id]
+            handlers.remove(handler)
+            if not handlers:
+                del self._crtc_event_handlers[crtc.id]
+        else:
+            self._event_handlers.remove(handler)
+
+    def new_commit_token(self) -> int:
+        """Get a unique token for a commit's user_data"""
+        token = self._next_commit_token
+        self._next_commit_token = (token + 1) & 0xffffffffffffffff or 1
+        return token
+
+    def add_commit_callback(self, token: int, crtc_ids: set[int],
+                            callback: Callable[[list[DrmEvent]], None]):
+        """Call the callback when the crtcs have sent the flip events with the token
+
+        If crtc_ids is empty, the callback is called on the first flip event.
+        Also used for the CRTC_SEQUENCE events of Crtc.queue_sequence().
+        """
+        self._commit_callbacks[token] = _PendingCommit(set(crtc_ids), callback)
+
+    def track_commit(self, token: int, crtc_ids: set[int],
+                     callback: Callable[[list[DrmEvent]], None] | None = None):
+        """Track a nonblocking commit, for the callback and for the pacing stats"""
+        if callback:
+            self.add_commit_callback(token, crtc_ids, callback)
+
+        if self.pacing_stats:
+            self.pacing_stats.commit_queued(token, crtc_ids)
+
+    def enable_pacing_stats(self) -> PacingStats:
+        """Start collecting frame pacing statistics from the card's events"""
+        if not self.pacing_stats:
+            # Fed by dispatch_events()
+            self.pacing_stats = PacingStats(self)
+        return self.pacing_stats
+
+    def disable_pacing_stats(self):
+        self.pacing_stats = None
+
+    def _complete_commit(self, ev: DrmEvent):
+        pending = self._commit_callbacks.get(ev.data)
+        if not pending:
+            return
+
+        pending.events.append(ev)
+        pending.crtc_ids.discard(ev.crtc_id)
+
+        if not pending.crtc_ids:
+            del self._commit_callbacks[ev.data]
+            pending.callback(pending.events)
+
+    def dispatch_events(self, events: list[DrmEvent]):
+        """Call the commit callbacks and the event handlers for the events"""
+        for ev in events:
+            # Count the flip before the callbacks and handlers, which may
+            # queue the next commit
+            if self.pacing_stats:
+                self.pacing_stats.handle_event(ev)
+
+            if ev.type != DrmEventType.VBLANK and self._commit_callbacks:
+                self._complete_commit(ev)
+
+            crtc_handlers = self._crtc_event_handlers.get(ev.crtc_id)
+            if crtc_handlers:
+                for handler in list(crtc_handlers):
+                    handler(ev)
+
+            for handler in list(self._event_handlers):
+                handler(ev)
+
+    def register_sequence(self, token: int, crtc_id: int,
+                          callback: Callable[[list[DrmEvent]], None] | None = None):
+        """Record the crtc of a queued CRTC_SEQUENCE event with the token as user_data"""
+        self._sequence_crtc_ids[token] = crtc_id
+
+        if callback:
+            self.add_commit_callback(token, {crtc_id}, callback)
+
+    def _set_sequence_crtc_ids(self, events: list[DrmEvent]):
+        for i, ev in enumerate(events):
+            if ev.type == DrmEventType.CRTC_SEQUENCE:
+                crtc_id = self._sequence_crtc_ids.pop(ev.data, None)
+                if crtc_id is not None:
+                    events[i] = ev._replace(crtc_id=crtc_id)
 
     def read_events(self) -> list[DrmEvent]:
+        """Read and decode all the pending events
+
+        The fd is read until it is empty, so a burst of events larger than
+        event_buf is not left waiting in the kernel.
+        """
         assert(self.fio)
 
         buf = self.event_buf
+        readinto = self.fio.readinto
 
-        l = self.fio.readinto(buf)
-        if not l:
-            return []
-
-        assert (l >= ctypes.sizeof(kms.uapi.drm_event))
-
-        events = []
-
-        i = 0
-        while i < l:
-            ev = kms.uapi.drm_event.from_buffer(buf, i)
-
-            #print(f'event type{ev.type}, len {ev.length}')
-
-            if ev.type == kms.uapi.DRM_EVENT_VBLANK:
-                raise NotImplementedError()
-            elif ev.type == kms.uapi.DRM_EVENT_FLIP_COMPLETE:
-                vblank = kms.uapi.drm_event_vblank.from_buffer(buf, i)
-                #print(vblank.sequence, vblank.tv_sec, vblank.tv_usec, vblank.crtc_id, vblank.user_data)
+        events: list[DrmEvent] = []
 
-                time = vblank.tv_sec + vblank.tv_usec / 1000000.0
+        # The card is opened in nonblocking mode: readinto() returns None
+        # when there are no more events
+        while True:
+            l = readinto(buf)
+            if not l:
+                break
 
-                events.append(DrmEvent(DrmEventType.FLIP_COMPLETE, vblank.sequence, time, vblank.user_data))
+            decode_events(buf, l, events)
 
-            elif ev.type == kms.uapi.DRM_EVENT_CRTC_SEQUENCE:
-                raise NotImplementedError()
-            else:
-                raise NotImplementedError()
+        if self._sequence_crtc_ids:
+            self._set_sequence_crtc_ids(events)
 
-            i += ev.length
+        if self._event_handlers or self._crtc_event_handlers or self._commit_callbacks:
+            self.dispatch_events(events)
 
         return events
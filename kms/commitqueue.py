@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import collections
+import errno
+
+from enum import Enum, auto
+from typing import TYPE_CHECKING, Callable
+
+import kms
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'CommitQueuePolicy', 'CommitQueue' ]
+
+class CommitQueuePolicy(Enum):
+    FIFO = auto()       # Commit all the requests in order
+    MAILBOX = auto()    # Only commit the latest request, drop the older ones
+    MERGE = auto()      # Merge the waiting requests into one, later values win
+
+class _QueuedCommit:
+    def __init__(self, req: kms.AtomicReq | kms.PreparedAtomicReq,
+                 callbacks: list[Callable[[list[kms.DrmEvent]], None]]) -> None:
+        self.req = req
+        self.callbacks = callbacks
+
+class CommitQueue:
+    """Nonblocking commits for a crtc, without EBUSY errors
+
+    A nonblocking commit fails with EBUSY if the previous commit on the crtc
+    has not flipped yet. The queue accepts requests at any rate with
+    submit(), and commits the next one when the previous flip completes.
+
+    While a flip is pending, the waiting requests are kept according to the
+    policy. With FIFO up to max_depth requests wait, and the oldest ones are
+    dropped when the queue is full. MAILBOX keeps only the latest request.
+    MERGE merges the waiting AtomicReqs into one, PreparedAtomicReqs
+    are replaced as with MAILBOX.
+
+    The callbacks of the dropped requests are not called. The callbacks of
+    merged requests are called when the merged request flips.
+
+    The FB_DAMAGE_CLIPS of a request are relative to the previous request,
+    so they are removed from the request that follows dropped or merged
+    requests, and the whole plane is updated instead.
+    """
+    def __init__(self, card: Card, crtc: kms.Crtc, policy = CommitQueuePolicy.MAILBOX,
+                 max_depth = 2) -> None:
+        self.card = card
+        self.crtc = crtc
+        self.policy = policy
+        self.max_depth = max_depth
+
+        self._queue: collections.deque[_QueuedCommit] = collections.deque()
+        self._pending_token = 0
+
+        self.submitted = 0
+        self.committed = 0
+        self.dropped = 0
+        self.merged = 0
+        # Commits which got EBUSY because of a commit done outside the queue
+        self.busy_retries = 0
+
+        card.add_event_handler(self._handle_event, crtc)
+
+    def close(self):
+        self.card.remove_event_handler(self._handle_event, self.crtc)
+        self._queue.clear()
+
+    @property
+    def depth(self) -> int:
+        """Number of requests waiting to be committed"""
+        return len(self._queue)
+
+    @property
+    def flip_pending(self) -> bool:
+        return self._pending_token != 0
+
+    def submit(self, req: kms.AtomicReq | kms.PreparedAtomicReq,
+               callback: Callable[[list[kms.DrmEvent]], None] | None = None):
+        """Commit the request now, or when the pending flip completes"""
+        self.submitted += 1
+
+        callbacks = [callback] if callback else []
+
+        queue = self._queue
+
+        if queue:
+            if self.policy == CommitQueuePolicy.MERGE:
+                last = queue[-1]
+                if isinstance(last.req, kms.AtomicReq) and isinstance(req, kms.AtomicReq):
+                    last.req = self._merge(last.req, req)
+                    self._drop_damage(last.req)
+                    last.callbacks += callbacks
+                    self.merged += 1
+                    return
+
+            if self.policy != CommitQueuePolicy.FIFO:
+                self.dropped += len(queue)
+                queue.clear()
+                self._drop_damage(req)
+
+        queue.append(_QueuedCommit(req, callbacks))
+
+        while len(queue) > self.max_depth:
+            queue.popleft()
+            self.dropped += 1
+            self._drop_damage(queue[0].req)
+
+        if not self._pending_token:
+            self._commit_next()
+
+    def _merge(self, old: kms.AtomicReq, new: kms.AtomicReq) -> kms.AtomicReq:
+        values = { (ob_id, prop_id): value for ob_id, prop_id, value in old.props }
+        values.update({ (ob_id, prop_id): value for ob_id, prop_id, value in new.props })
+
+        req = kms.AtomicReq(self.card, delta=old.delta)
+        req.props = [(ob_id, prop_id, value) for (ob_id, prop_id), value in values.items()]
+        # Keep the blobs of both requests alive until the commit
+        req._blobs = old._blobs + new._blobs
+        # and the OUT_FENCE_PTR targets, the later ones win as the props do
+        req._out_fences = {**old._out_fences, **new._out_fences}
+        return req
+
+    def _drop_damage(self, req: kms.AtomicReq | kms.PreparedAtomicReq):
+        damage_props = [(ob_id, prop_id) for ob_id, prop_id, _ in req.props
+                        if self.card.find_property_name(prop_id) == 'FB_DAMAGE_CLIPS']
+
+        if not damage_props:
+            return
+
+        if isinstance(req, kms.AtomicReq):
+            req.props = [p for p in req.props if (p[0], p[1]) not in damage_props]
+        else:
+            for ob_id, prop_id in damage_props:
+                req.set(ob_id, prop_id, 0)
+
+    def _commit_next(self):
+        qc = self._queue[0]
+
+        try:
+            token = qc.req.commit(callback=lambda events: self._flip_done(qc, events))
+        except OSError as e:
+            if e.errno != errno.EBUSY:
+                raise
+            # A commit done outside the queue is pending, retry on its flip
+            self.busy_retries += 1
+            return
+
+        self._queue.popleft()
+        self._pending_token = token
+        self.committed += 1
+
+    def _flip_done(self, qc: _QueuedCommit, events: list[kms.DrmEvent]):
+        self._pending_token = 0
+
+        for callback in qc.callbacks:
+            callback(events)
+
+        if self._queue:
+            self._commit_next()
+
+    def _handle_event(self, ev: kms.DrmEvent):
+        # Retry after an EBUSY, when another commit on the crtc has flipped
+        if ev.type == kms.DrmEventType.FLIP_COMPLETE and not self._pending_token and self._queue:
+            self._commit_next()
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'submitted': self.submitted,
+            'committed': self.committed,
+            'dropped': self.dropped,
+            'merged': self.merged,
+            'busy_retries': self.busy_retries,
+        }
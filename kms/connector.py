@@ -60,6 +60,11 @@ class Connector(kms.DrmPropObject):
         self.encoder_ids = encoder_ids
         self.modes = [kms.VideoMode(m) for m in modes]
 
+        # GETCONNECTOR returns the property values too, so use them instead of
+        # doing a separate OBJ_GETPROPERTIES in lazy mode
+        if self._prop_values is None:
+            self._prop_values = {int(prop_ids[i]): int(prop_values[i]) for i in range(res.count_props)}
+
         self.fullname = f'{Connector.connector_names[res.connector_type]}-{res.connector_type_id}'
 
         #print(f"connector {id}: type: {res.connector_type}, num_modes: {len(self.modes)}")
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import errno
 import fcntl
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable
 
 import kms
 import kms.uapi
@@ -16,18 +17,158 @@ class Crtc(kms.DrmPropObject):
     def __init__(self, card: Card, id, idx) -> None:
         super().__init__(card, id, kms.uapi.DRM_MODE_OBJECT_CRTC, idx)
 
+        self.refresh()
+
+        #print(f"CRTC {id}: fb: {self.crtc_res.fb_id}")
+
+    def refresh(self):
         res = kms.uapi.drm_mode_crtc()
 
-        res.crtc_id = id
+        res.crtc_id = self.id
 
-        fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_MODE_GETCRTC, res, True)
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_MODE_GETCRTC, res, True)
         self.crtc_res = res
 
-        #print(f"CRTC {id}: fb: {res.fb_id}")
-
     def __repr__(self) -> str:
         return f'Crtc({self.id})'
 
+    def get_sequence(self) -> tuple[int, int]:
+        """Get the current vblank sequence and its CLOCK_MONOTONIC timestamp in ns"""
+        seq = kms.uapi.drm_crtc_get_sequence()
+        seq.crtc_id = self.id
+
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_CRTC_GET_SEQUENCE, seq, True)
+
+        return (seq.sequence, seq.sequence_ns)
+
+    def queue_sequence(self, target: int, relative=True, next_on_miss=False,
+                       callback: Callable[[list[kms.DrmEvent]], None] | None = None) -> int:
+        """Request a CRTC_SEQUENCE event at the target vblank
+
+        The event is delivered by Card.read_events(), with the crtc_id of
+        this crtc, and passed to callback if given. Returns the absolute
+        sequence of the event.
+        """
+        card = self.card
+
+        flags = 0
+        if relative:
+            flags |= kms.uapi.DRM_CRTC_SEQUENCE_RELATIVE
+        if next_on_miss:
+            flags |= kms.uapi.DRM_CRTC_SEQUENCE_NEXT_ON_MISS
+
+        token = card.new_commit_token()
+
+        seq = kms.uapi.drm_crtc_queue_sequence()
+        seq.crtc_id = self.id
+        seq.flags = flags
+        seq.sequence = target
+        seq.user_data = token
+
+        fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_CRTC_QUEUE_SEQUENCE, seq, True)
+
+        card.register_sequence(token, self.id, callback)
+
+        return seq.sequence
+
+    def page_flip(self, fb: kms.Framebuffer, target: int | None = None, relative = True,
+                  async_flip = False,
+                  callback: Callable[[list[kms.DrmEvent]], None] | None = None) -> int:
+        """Flip the crtc's primary plane to fb with the legacy page flip ioctl
+
+        If target is given, the flip is done at that vblank sequence, or
+        relative to the current one. The kernel only accepts a target up to
+        the next vblank, so for later targets the flip is issued from a
+        CRTC_SEQUENCE event on the preceding vblank. Without
+        DRM_CAP_PAGE_FLIP_TARGET the flip is done without the target flag.
+
+        If async_flip is set, the flip is done without waiting for vblank if
+        the card supports it. async_flip cannot be used with a target.
+
+        Returns the flip's token, see AtomicReq.commit().
+        """
+        if async_flip and target is not None:
+            raise ValueError('Async flips cannot have a target vblank')
+
+        token = self.card.new_commit_token()
+
+        if target is None:
+            self._page_flip(fb, None, async_flip, token, callback)
+            return token
+
+        current, _ = self.get_sequence()
+
+        if relative:
+            target += current
+
+        if target - current <= 1:
+            self._page_flip(fb, target, False, token, callback)
+        else:
+            self.queue_sequence(target - 1, relative=False,
+                                callback=lambda _: self._page_flip(fb, target, False, token, callback))
+
+        return token
+
+    def _page_flip(self, fb: kms.Framebuffer, target: int | None, async_flip: bool, token: int,
+                   callback: Callable[[list[kms.DrmEvent]], None] | None):
+        card = self.card
+
+        flip = kms.uapi.drm_mode_crtc_page_flip_target()
+        flip.crtc_id = self.id
+        flip.fb_id = fb.id
+        flip.flags = kms.uapi.DRM_MODE_PAGE_FLIP_EVENT
+        flip.user_data = token
+
+        if target is not None and card.supports_page_flip_target:
+            flip.flags |= kms.uapi.DRM_MODE_PAGE_FLIP_TARGET_ABSOLUTE
+            # The vblank counter of the legacy ioctls is 32 bits
+            flip.sequence = target & 0xffffffff
+
+        if async_flip and card.supports_async_page_flip:
+            flip.flags |= kms.uapi.DRM_MODE_PAGE_FLIP_ASYNC
+            try:
+                fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_MODE_PAGE_FLIP, flip, True)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                # The flip cannot be done asynchronously, fall back to a vsynced flip
+                flip.flags &= ~kms.uapi.DRM_MODE_PAGE_FLIP_ASYNC
+                fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_MODE_PAGE_FLIP, flip, True)
+        else:
+            fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_MODE_PAGE_FLIP, flip, True)
+
+        # The primary plane's FB_ID was changed outside of the atomic API
+        for plane in self.get_possible_planes():
+            if plane.plane_type == kms.PlaneType.PRIMARY and plane.get_prop_value('CRTC_ID') == self.id:
+                plane.invalidate_props()
+
+        if callback or card.pacing_stats:
+            card.track_commit(token, {self.id}, callback)
+
+    def wait_vblank(self, count=1) -> tuple[int, int]:
+        """Block until count vblanks have passed
+
+        Returns the vblank sequence and its timestamp in ns, in the card's
+        timestamp clock.
+        """
+        vbl = kms.uapi.drm_wait_vblank()
+
+        # drm.h defines the vblank flags with a leading underscore
+        uapi = kms.uapi.kms
+
+        req_type = uapi._DRM_VBLANK_RELATIVE
+        if self.idx == 1:
+            req_type |= uapi._DRM_VBLANK_SECONDARY
+        elif self.idx > 1:
+            req_type |= (self.idx << uapi._DRM_VBLANK_HIGH_CRTC_SHIFT) & uapi._DRM_VBLANK_HIGH_CRTC_MASK
+
+        vbl.request.type = req_type
+        vbl.request.sequence = count
+
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_WAIT_VBLANK, vbl, True)
+
+        return (vbl.reply.sequence, vbl.reply.tval_sec * 1000000000 + vbl.reply.tval_usec * 1000)
+
     def get_possible_planes(self):
         return [p for p in self.card.planes if p.supports_crtc(self)]
 
@@ -35,12 +176,29 @@ class Crtc(kms.DrmPropObject):
     def mode(self):
         return kms.VideoMode(self.crtc_res.mode)
 
+    def is_mode_set(self, connector: kms.Connector, mode: kms.VideoMode):
+        """Check if the connector is already driven by this crtc with the given mode"""
+        if connector.get_prop_value('CRTC_ID') != self.id:
+            return False
+
+        if not self.get_prop_value('ACTIVE'):
+            return False
+
+        # The mode in crtc_res may be stale, e.g. after our own modesets
+        self.refresh()
+
+        if not self.crtc_res.mode_valid:
+            return False
+
+        return self.mode.matches(mode)
+
     @property
     def primary_plane(self):
-        plane = next((p for p in self.get_possible_planes() if p.type == kms.PlaneType.PRIMARY and p.crtc_id == self.id), None)
+        plane = next((p for p in self.get_possible_planes()
+                      if p.plane_type == kms.PlaneType.PRIMARY and p.get_prop_value('CRTC_ID') == self.id), None)
         if plane:
             return plane
-        plane = next((p for p in self.get_possible_planes() if p.type == kms.PlaneType.PRIMARY), None)
+        plane = next((p for p in self.get_possible_planes() if p.plane_type == kms.PlaneType.PRIMARY), None)
         if plane:
             return plane
         plane = next((p for p in self.get_possible_planes()), None)
@@ -7,6 +7,8 @@ import numpy as np
 if TYPE_CHECKING:
     from kms import Framebuffer
 
+__all__ = [ 'RGB', 'plane_view', 'NumpyFramebuffer' ]
+
 class RGB:
     def __init__(self, a, r, g, b):
         self.a = a
@@ -17,24 +19,54 @@ class RGB:
     def to_rgba(self):
         return (self.b << 0) | (self.g << 8) | (self.r << 16) | (self.a << 24)
 
+def plane_view(fb: Framebuffer, plane_idx=0, as_bytes=False) -> np.ndarray:
+    """Get a zero-copy numpy view of a framebuffer plane
+
+    The view uses the plane's pitch, so padding at the end of the lines is
+    skipped, and the plane's subsampling, so e.g. the NV12 UV plane has
+    height / 2 lines of width / 2 blocks.
+
+    If the format has one pixel per block of 1, 2, 4 or 8 bytes, e.g.
+    XRGB8888 or RGB565, the view has shape (lines, pixels) and an unsigned
+    integer dtype of the block size. Otherwise, e.g. for RGB888 or YUYV, and
+    if as_bytes is set, the view has shape (lines, blocks, bytes_per_block)
+    and uint8 dtype.
+
+    The view keeps the framebuffer alive.
+    """
+    return np.asarray(fb.plane_buffer(plane_idx, as_bytes))
+
 class NumpyFramebuffer:
+    """Drawing into a framebuffer with numpy
+
+    The drawing functions add the drawn regions to the framebuffer's damage.
+    """
     def __init__(self, fb: Framebuffer, prepopulate=False):
-        map = fb.map(0)
-        self.b = np.frombuffer(map, dtype=np.int32).reshape(fb.height, fb.width)
+        self.fb = fb
+
+        # Views of all the planes, and the first plane as a shortcut
+        self.planes = [plane_view(fb, idx) for idx in range(len(fb.planes))]
+        self.b = self.planes[0]
 
         # Is there a better way to populate page tables
         if prepopulate:
-            self.b[:,:] = 0
+            for b in self.planes:
+                b[...] = 0
+            fb.damage_all()
 
     def fill_rect(self, x, y, w, h, c):
         if isinstance(c, RGB):
             c = c.to_rgba()
 
         self.b[y:y+h, x:x+w] = c
+        self.fb.add_damage(x, y, w, h)
 
     def draw_gradient(self, x, y, h, gradient):
         self.b[y:y+h, x:x+len(gradient)] = gradient
+        self.fb.add_damage(x, y, len(gradient), h)
 
     def draw_color_bar(self, old_xpos, new_xpos, bar_width):
         self.b[:, old_xpos:old_xpos+bar_width] = 0
         self.b[:, new_xpos:new_xpos+bar_width] = 0xffffff
+        self.fb.add_damage(old_xpos, 0, bar_width, self.fb.height)
+        self.fb.add_damage(new_xpos, 0, bar_width, self.fb.height)
@@ -1,15 +1,72 @@
 from __future__ import annotations
 
+import struct
+
 from enum import Enum, auto
+from typing import NamedTuple
+
+import kms.uapi
 
-__all__ = [ 'DrmEventType', 'DrmEvent' ]
+__all__ = [ 'DrmEventType', 'DrmEvent', 'decode_events' ]
 
 class DrmEventType(Enum):
     FLIP_COMPLETE = auto()
+    VBLANK = auto()
+    CRTC_SEQUENCE = auto()
+
+class DrmEvent(NamedTuple):
+    type: DrmEventType
+    seq: int
+    # Timestamp in nanoseconds. CRTC_SEQUENCE timestamps are always in
+    # CLOCK_MONOTONIC, VBLANK and FLIP_COMPLETE timestamps are in the card's
+    # clock, see Card.timestamp_monotonic. Use Card.event_time_monotonic_ns()
+    # to get a time comparable with time.monotonic_ns().
+    time_ns: int
+    data: int
+    # 0 if the event does not tell the crtc (CRTC_SEQUENCE events, or
+    # VBLANK events without DRM_CAP_CRTC_IN_VBLANK_EVENT)
+    crtc_id: int = 0
+
+    @property
+    def time(self) -> float:
+        """Timestamp in seconds"""
+        return self.time_ns / 1000000000
+
+    def __repr__(self) -> str:
+        return f'DrmEvent({self.type.name}, crtc={self.crtc_id}, seq={self.seq}, time_ns={self.time_ns})'
+
+# struct drm_event, drm_event_vblank and drm_event_crtc_sequence
+_HEADER = struct.Struct('=II')
+_VBLANK = struct.Struct('=8xQIIII')
+_CRTC_SEQUENCE = struct.Struct('=8xQqQ')
+
+_VBLANK_TYPES = {
+    kms.uapi.DRM_EVENT_VBLANK: DrmEventType.VBLANK,
+    kms.uapi.DRM_EVENT_FLIP_COMPLETE: DrmEventType.FLIP_COMPLETE,
+}
+
+def decode_events(buf, length: int, events: list[DrmEvent]):
+    """Decode the events in buf[:length] and append them to events
+
+    Unknown and driver specific events are skipped.
+    """
+    header = _HEADER.unpack_from
+    vblank = _VBLANK.unpack_from
+    crtc_sequence = _CRTC_SEQUENCE.unpack_from
+    new_event = DrmEvent._make
+    append = events.append
+
+    i = 0
+    while i < length:
+        ev_type, ev_len = header(buf, i)
+
+        vblank_type = _VBLANK_TYPES.get(ev_type)
+
+        if vblank_type:
+            user_data, tv_sec, tv_usec, seq, crtc_id = vblank(buf, i)
+            append(new_event((vblank_type, seq, tv_sec * 1000000000 + tv_usec * 1000, user_data, crtc_id)))
+        elif ev_type == kms.uapi.DRM_EVENT_CRTC_SEQUENCE:
+            user_data, time_ns, seq = crtc_sequence(buf, i)
+            append(new_event((DrmEventType.CRTC_SEQUENCE, seq, time_ns, user_data, 0)))
 
-class DrmEvent:
-    def __init__(self, type, seq, time, data):
-        self.type = type
-        self.seq = seq
-        self.time = time
-        self.data = data
+        i += ev_len
@@ -24,6 +24,8 @@ class DrmPropertyType(Enum):
 
 
 class DrmProperty(kms.DrmObject):
+    VOLATILE_PROPS = ('IN_FENCE_FD', 'OUT_FENCE_PTR', 'FB_DAMAGE_CLIPS')
+
     def __init__(self, card: Card, id) -> None:
         super().__init__(card, id, kms.uapi.DRM_MODE_OBJECT_PROPERTY, -1)
 
@@ -32,6 +34,10 @@ class DrmProperty(kms.DrmObject):
 
         self.name = prop.name.decode('ascii')
 
+        # Write-only or per-commit properties, which don't read back the
+        # value that was committed
+        self.volatile = self.name in DrmProperty.VOLATILE_PROPS
+
         self.immutable = prop.flags & kms.uapi.DRM_MODE_PROP_IMMUTABLE
         self.atomic = prop.flags & kms.uapi.DRM_MODE_PROP_ATOMIC
 
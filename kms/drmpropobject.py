@@ -3,7 +3,7 @@ from __future__ import annotations
 import ctypes
 import fcntl
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterable
 
 import kms
 import kms.uapi
@@ -16,7 +16,20 @@ __all__ = [ 'DrmPropObject', ]
 class DrmPropObject(kms.DrmObject):
     def __init__(self, card: Card, id, type, idx) -> None:
         super().__init__(card, id, type, idx)
-        self.refresh_props()
+
+        self._prop_values: dict[int, int] | None = None
+        self._prop_ids_by_name: dict[str, int] | None = None
+        self._dup_prop_ids_by_name: dict[str, list[int]] = {}
+
+        if not card.lazy:
+            self.refresh_props()
+
+    @property
+    def prop_values(self) -> dict[int, int]:
+        if self._prop_values is None:
+            self.refresh_props()
+            assert self._prop_values is not None
+        return self._prop_values
 
     def refresh_props(self):
         props = kms.uapi.drm_mode_obj_get_properties()
@@ -33,11 +46,62 @@ class DrmPropObject(kms.DrmObject):
 
         fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_MODE_OBJ_GETPROPERTIES, props, True)
 
-        self.prop_values = {int(prop_ids[i]): int(prop_values[i]) for i in range(props.count_props)}
+        new_values = {int(prop_ids[i]): int(prop_values[i]) for i in range(props.count_props)}
+
+        if self._prop_values is None or self._prop_values.keys() != new_values.keys():
+            self._prop_ids_by_name = None
+
+        self._prop_values = new_values
+
+    def update_committed_prop(self, prop_id: int, value: int):
+        """Update the cached property value after a successful commit"""
+        if self._prop_values is not None:
+            self._prop_values[prop_id] = value & 0xffffffffffffffff
+
+    def update_committed_props(self, values: Iterable[tuple[int, int]]):
+        """Update the cached values after a successful commit from unsigned
+        (prop ID, value) pairs"""
+        if self._prop_values is not None:
+            self._prop_values.update(values)
+
+    def invalidate_props(self):
+        """Drop the cached property values, they will be re-read on next use"""
+        if self._prop_values is not None:
+            self._prop_values = None
+            self._prop_ids_by_name = None
+
+    @property
+    def prop_ids_by_name(self) -> dict[str, int]:
+        """Property name to property ID mapping
+
+        If the object has multiple properties with the same name, the first one
+        is in the mapping. All of them can be found with get_prop_ids().
+        """
+        if self._prop_ids_by_name is None:
+            ids: dict[str, int] = {}
+            dups: dict[str, list[int]] = {}
+
+            for prop_id in self.prop_values:
+                name = self.card.find_property_name(prop_id)
+                if name in ids:
+                    dups.setdefault(name, [ids[name]]).append(prop_id)
+                else:
+                    ids[name] = prop_id
+
+            self._prop_ids_by_name = ids
+            self._dup_prop_ids_by_name = dups
+
+        return self._prop_ids_by_name
+
+    def get_prop_id(self, prop_name: str) -> int:
+        return self.prop_ids_by_name[prop_name]
+
+    def get_prop_ids(self, prop_name: str) -> list[int]:
+        prop_id = self.prop_ids_by_name[prop_name]
+        return self._dup_prop_ids_by_name.get(prop_name, [prop_id])
 
     def get_prop_value(self, prop_name: str):
-        prop_id = self.card.find_property_id(self, prop_name)
-        assert(prop_id in self.prop_values)
+        prop_id = self.get_prop_id(prop_name)
         return self.prop_values[prop_id]
 
     def set_prop(self, prop, value):
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import ctypes
+import errno
 import fcntl
 import mmap
 import os
@@ -18,6 +19,20 @@ if TYPE_CHECKING:
 
 __all__ = [ 'Framebuffer', 'DumbFramebuffer', 'DmabufFramebuffer', 'ExtFramebuffer' ]
 
+# Damage rectangles, (x, y, w, h), kept before they are merged to their bounding box
+_MAX_DAMAGE_RECTS = 16
+
+def _merge_damage(rects: list[tuple[int, int, int, int]]) -> list[tuple[int, int, int, int]]:
+    if len(rects) <= _MAX_DAMAGE_RECTS:
+        return rects
+
+    x1 = min(r[0] for r in rects)
+    y1 = min(r[1] for r in rects)
+    x2 = max(r[0] + r[2] for r in rects)
+    y2 = max(r[1] + r[3] for r in rects)
+
+    return [(x1, y1, x2 - x1, y2 - y1)]
+
 class Framebuffer(kms.DrmObject):
     class FramebufferPlane:
         def __init__(self) -> None:
@@ -28,14 +43,21 @@ class Framebuffer(kms.DrmObject):
             self.offset = 0
             self.map: mmap.mmap | None = None
 
-    def __init__(self, card: Card, id: int, width: int, height: int, format: kms.PixelFormat, planes: list[FramebufferPlane]) -> None:
+    def __init__(self, card: Card, id: int, width: int, height: int, format: kms.PixelFormat, planes: list[FramebufferPlane],
+                 modifier: int = 0) -> None:
         super().__init__(card, id, kms.uapi.DRM_MODE_OBJECT_FB, -1)
 
         self.width = width
         self.height = height
         self.format = format
+        self.modifier = modifier
         self.planes = planes
 
+        # The regions changed since the damage was last taken, (x, y, w, h)
+        self.damage: list[tuple[int, int, int, int]] = []
+
+        card.register_framebuffer(self)
+
     def size(self, plane_idx):
         return self.planes[plane_idx].size
 
@@ -45,7 +67,71 @@ class Framebuffer(kms.DrmObject):
     def mmap(self) -> list[mmap.mmap]:
         return [self.map(pidx) for pidx in range(len(self.planes))]
 
+    def plane_buffer(self, plane_idx = 0, as_bytes = False) -> kms.PlaneBuffer:
+        """Export the plane for numpy, DLPack and the buffer protocol
+
+        The arrays created from the export keep the framebuffer alive, so
+        there's no need to release them before the framebuffer.
+        """
+        return kms.PlaneBuffer(self, plane_idx, as_bytes)
+
+    def add_damage(self, x: int, y: int, w: int, h: int):
+        """Mark a region as changed
+
+        The damage is sent with the next AtomicReq.add_plane() or dirty()
+        of the framebuffer, so the driver only needs to update the changed
+        regions, e.g. on manual update panels or USB displays.
+        """
+        x1 = max(x, 0)
+        y1 = max(y, 0)
+        x2 = min(x + w, self.width)
+        y2 = min(y + h, self.height)
+
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        self.damage.append((x1, y1, x2 - x1, y2 - y1))
+        self.damage = _merge_damage(self.damage)
+
+    def damage_all(self):
+        self.damage = [(0, 0, self.width, self.height)]
+
+    def take_damage(self) -> list[tuple[int, int, int, int]]:
+        """Get and clear the damage"""
+        damage = self.damage
+        self.damage = []
+        return damage
+
+    def dirty(self) -> bool:
+        """Flush the damage with DRM_IOCTL_MODE_DIRTYFB
+
+        This is for the legacy, non-atomic, paths, e.g. when drawing into a
+        framebuffer that is on the screen. Without damage, the whole
+        framebuffer is flushed. Returns False if the driver does not need
+        the flushes.
+        """
+        damage = self.take_damage()
+
+        clips = (kms.uapi.drm_clip_rect * len(damage))(
+            *[(x, y, x + w, y + h) for x, y, w, h in damage])
+
+        cmd = kms.uapi.drm_mode_fb_dirty_cmd()
+        cmd.fb_id = self.id
+        cmd.num_clips = len(damage)
+        cmd.clips_ptr = ctypes.addressof(clips)
+
+        try:
+            fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_MODE_DIRTYFB, cmd, True)
+        except OSError as e:
+            if e.errno != errno.ENOSYS:
+                raise
+            return False
+
+        return True
+
     def clear(self):
+        self.damage_all()
+
         for idx in range(len(self.planes)):
             # Can't we just create a ubyte pointer type and use it, instead of
             # creating a ubyte[planesize] type for each plane?
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+
+from typing import TYPE_CHECKING
+
+import kms
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'FramebufferPool' ]
+
+class FramebufferPool:
+    """Recycles dumb framebuffers by their size, format and modifier
+
+    Framebuffers are taken from the pool with get() and given back with
+    put(). The returned framebuffers keep their mmaps, so a recycled
+    framebuffer is ready to be drawn into. The contents of a recycled
+    framebuffer are whatever was last drawn into it.
+
+    The idle framebuffers in the pool are limited to max_bytes. When the
+    limit is exceeded, the least recently returned framebuffers are freed.
+    """
+    def __init__(self, card: Card, max_bytes=64 * 1024 * 1024) -> None:
+        self.card = card
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        # Idle framebuffers in buckets by (width, height, format, modifier)
+        self._buckets: dict[tuple, list[kms.DumbFramebuffer]] = {}
+        # The idle framebuffers' IDs and keys, least recently returned first
+        self._lru: OrderedDict[int, tuple] = OrderedDict()
+
+    @staticmethod
+    def _fb_size(fb: kms.Framebuffer):
+        return sum(p.size for p in fb.planes)
+
+    def get(self, width: int, height: int, format: kms.PixelFormat, modifier: int = 0) -> kms.DumbFramebuffer:
+        if modifier != 0:
+            raise ValueError('Dumb framebuffers only support the linear modifier')
+
+        bucket = self._buckets.get((width, height, format.drm_fourcc, modifier))
+
+        if bucket:
+            fb = bucket.pop()
+            del self._lru[fb.id]
+            self.size -= FramebufferPool._fb_size(fb)
+            self.hits += 1
+            return fb
+
+        self.misses += 1
+
+        return kms.DumbFramebuffer(self.card, width, height, format)
+
+    def put(self, fb: kms.DumbFramebuffer):
+        if not isinstance(fb, kms.DumbFramebuffer):
+            raise TypeError('Only dumb framebuffers can be pooled')
+
+        if fb.id in self._lru:
+            raise RuntimeError('Framebuffer already in the pool')
+
+        # The damage of the previous user is meaningless for the next one
+        fb.damage = []
+
+        # Keep the framebuffer mapped, so that it's ready for the next user
+        fb.mmap()
+
+        key = (fb.width, fb.height, fb.format.drm_fourcc, fb.modifier)
+
+        self._buckets.setdefault(key, []).append(fb)
+        self._lru[fb.id] = key
+        self.size += FramebufferPool._fb_size(fb)
+
+        self._evict(self.max_bytes)
+
+    def _evict(self, max_bytes: int):
+        while self.size > max_bytes and self._lru:
+            fb_id, key = self._lru.popitem(last=False)
+
+            bucket = self._buckets[key]
+            fb = next(fb for fb in bucket if fb.id == fb_id)
+            bucket.remove(fb)
+            if not bucket:
+                del self._buckets[key]
+
+            self.size -= FramebufferPool._fb_size(fb)
+            self.evictions += 1
+
+    def clear(self):
+        """Free all the idle framebuffers"""
+        self._evict(0)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'free': len(self._lru),
+            'size': self.size,
+        }
+
+    def __len__(self):
+        return len(self._lru)
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import time
+
+from typing import TYPE_CHECKING, Callable
+
+import kms
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'FrameScheduler' ]
+
+RenderCallback = Callable[[int], 'kms.AtomicReq | kms.PreparedAtomicReq | None']
+
+class FrameScheduler:
+    """Late latching frame scheduler for a crtc
+
+    Instead of rendering right after a flip completes, the scheduler
+    predicts the next vblank from the flip timestamps and the mode timings,
+    and calls render as late as the measured render time allows. render
+    is given the predicted vblank time, in time.monotonic_ns() clock, and
+    returns the request to commit, or None to skip the frame.
+
+    The render budget is the longest of the recent render and commit times.
+    The safety margin on top of it grows when a frame misses its vblank,
+    and slowly shrinks back to min_margin_ns when frames are on time.
+
+    The nominal frame period comes from mode, or if not given, from the
+    crtc's current mode, so create the scheduler after the modeset.
+    """
+    def __init__(self, card: Card, crtc: kms.Crtc, render: RenderCallback,
+                 min_margin_ns = 1000000, num_samples = 32,
+                 mode: kms.VideoMode | None = None) -> None:
+        self.card = card
+        self.crtc = crtc
+        self.render = render
+
+        self.min_margin_ns = min_margin_ns
+        self.margin_ns = min_margin_ns
+
+        if mode is None:
+            # The cached crtc state may predate the modeset
+            crtc.refresh()
+            mode = crtc.mode
+        self.period_ns = mode.frame_period_ns
+        self.last_vblank_ns = 0
+
+        self._render_times: collections.deque[int] = collections.deque(maxlen=num_samples)
+
+        self._running = False
+
+        self.frames = 0
+        self.missed_frames = 0
+        self.skipped_frames = 0
+        # Time from waking up to render to the flip, i.e. how old the
+        # content is when it reaches the screen
+        self.last_latency_ns = 0
+
+    @property
+    def render_budget_ns(self) -> int:
+        return max(self._render_times, default=self.period_ns // 2)
+
+    def predict_vblank(self, after_ns: int) -> int:
+        """Predict the time of the first vblank after after_ns"""
+        last = self.last_vblank_ns
+        period = self.period_ns
+
+        if after_ns <= last:
+            return last + period
+
+        return last + -(-(after_ns - last) // period) * period
+
+    def _update_vblank(self, vblank_ns: int):
+        # Refine the period from the measured vblank times, as the real
+        # refresh rate differs slightly from the nominal one
+        if self.last_vblank_ns:
+            n = round((vblank_ns - self.last_vblank_ns) / self.period_ns)
+            if n > 0:
+                measured = (vblank_ns - self.last_vblank_ns) // n
+                self.period_ns += (measured - self.period_ns) // 8
+
+        self.last_vblank_ns = vblank_ns
+
+    def _update_margin(self, missed: bool):
+        if missed:
+            self.margin_ns = min(self.margin_ns * 2, self.period_ns // 2)
+        else:
+            self.margin_ns = max(self.min_margin_ns,
+                                 self.margin_ns - (self.margin_ns - self.min_margin_ns) // 16)
+
+    def stop(self):
+        self._running = False
+
+    async def run(self, num_frames: int | None = None):
+        """Schedule frames until stop() is called or num_frames have been shown"""
+        aio = kms.AsyncCard.get(self.card)
+
+        _, vblank_ns = self.crtc.get_sequence()
+        self._update_vblank(vblank_ns)
+
+        self._running = True
+
+        while self._running and (num_frames is None or self.frames < num_frames):
+            now = time.monotonic_ns()
+
+            target_ns = self.predict_vblank(now + self.render_budget_ns + self.margin_ns)
+            wake_ns = target_ns - self.render_budget_ns - self.margin_ns
+
+            if wake_ns > now:
+                await asyncio.sleep((wake_ns - now) / 1000000000)
+
+            ts1 = time.monotonic_ns()
+
+            req = self.render(target_ns)
+            if not req:
+                self.skipped_frames += 1
+                # Nothing to show for this vblank, wait until it has passed
+                await asyncio.sleep(max(target_ns - time.monotonic_ns(), 0) / 1000000000)
+                self._update_vblank(target_ns)
+                continue
+
+            fut: asyncio.Future[list[kms.DrmEvent]] = aio.loop.create_future()
+
+            def done(events: list[kms.DrmEvent], fut=fut):
+                # The future is cancelled if run() was cancelled while waiting
+                if not fut.done():
+                    fut.set_result(events)
+
+            req.commit(callback=done)
+
+            self._render_times.append(time.monotonic_ns() - ts1)
+
+            events = await fut
+
+            flip_ns = self.card.event_time_monotonic_ns(events[0])
+
+            missed = flip_ns > target_ns + self.period_ns // 2
+
+            self.frames += 1
+            if missed:
+                self.missed_frames += 1
+
+            self.last_latency_ns = flip_ns - ts1
+
+            self._update_margin(missed)
+            self._update_vblank(flip_ns)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'missed': self.missed_frames,
+            'skipped': self.skipped_frames,
+            'period_ns': self.period_ns,
+            'render_budget_ns': self.render_budget_ns,
+            'margin_ns': self.margin_ns,
+            'latency_ns': self.last_latency_ns,
+        }
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import collections
+import json
+import math
+import time
+
+from typing import TYPE_CHECKING
+
+import kms
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'PacingStats', 'CrtcPacingStats' ]
+
+class CrtcPacingStats:
+    """Frame pacing statistics of a single crtc
+
+    The flip intervals are collected to a histogram with 1 ms buckets, and
+    the last num_samples intervals are kept for the jitter, i.e. the
+    standard deviation of the intervals.
+    """
+    def __init__(self, crtc_id: int, num_samples = 120) -> None:
+        self.crtc_id = crtc_id
+
+        self.flips = 0
+        # Vblanks without a flip, from the gaps in the flip sequences
+        self.skipped_vblanks = 0
+
+        self.last_seq: int | None = None
+        self.last_time_ns = 0
+
+        self.interval_histogram: collections.Counter[int] = collections.Counter()
+        self.intervals: collections.deque[int] = collections.deque(maxlen=num_samples)
+
+        # Commit to flip latency, of the commits done with kms.AtomicReq
+        self.latency_count = 0
+        self.latency_sum_ns = 0
+        self.latency_max_ns = 0
+
+        # Nonblocking commits waiting for the flip
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    @property
+    def jitter_ns(self) -> float:
+        n = len(self.intervals)
+        if n < 2:
+            return 0.0
+
+        mean = sum(self.intervals) / n
+        return math.sqrt(sum((i - mean) ** 2 for i in self.intervals) / n)
+
+    def add_flip(self, seq: int, time_ns: int):
+        self.flips += 1
+
+        if self.last_seq is not None:
+            # The vblank sequence in flip events is 32 bits and wraps
+            delta = (seq - self.last_seq) & 0xffffffff
+            if delta > 1:
+                self.skipped_vblanks += delta - 1
+
+            interval = time_ns - self.last_time_ns
+            self.interval_histogram[interval // 1000000] += 1
+            self.intervals.append(interval)
+
+        self.last_seq = seq
+        self.last_time_ns = time_ns
+
+    def add_latency(self, latency_ns: int):
+        self.latency_count += 1
+        self.latency_sum_ns += latency_ns
+        self.latency_max_ns = max(self.latency_max_ns, latency_ns)
+
+    def to_dict(self):
+        intervals = self.intervals
+
+        return {
+            'flips': self.flips,
+            'skipped_vblanks': self.skipped_vblanks,
+            'interval_mean_ns': sum(intervals) // len(intervals) if intervals else 0,
+            'interval_min_ns': min(intervals, default=0),
+            'interval_max_ns': max(intervals, default=0),
+            'jitter_ns': round(self.jitter_ns),
+            'interval_histogram_ms': { str(ms): n for ms, n in sorted(self.interval_histogram.items()) },
+            'latency_mean_ns': self.latency_sum_ns // self.latency_count if self.latency_count else 0,
+            'latency_max_ns': self.latency_max_ns,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+        }
+
+class PacingStats:
+    """Frame pacing statistics of a card's crtcs, collected from the flip events
+
+    Use Card.enable_pacing_stats() to attach to a card. The statistics
+    can be read at any time with crtc(), to_dict() or to_json().
+    """
+    def __init__(self, card: Card) -> None:
+        self.card = card
+        self.crtcs: dict[int, CrtcPacingStats] = {}
+
+        # Commit token -> (commit time, crtc ids not yet flipped)
+        self._pending: dict[int, tuple[int, set[int]]] = {}
+
+    def crtc(self, crtc_id: int) -> CrtcPacingStats:
+        stats = self.crtcs.get(crtc_id)
+        if not stats:
+            stats = CrtcPacingStats(crtc_id)
+            self.crtcs[crtc_id] = stats
+        return stats
+
+    def reset(self):
+        self.crtcs.clear()
+        self._pending.clear()
+
+    def commit_queued(self, token: int, crtc_ids: set[int]):
+        self._pending[token] = (time.monotonic_ns(), set(crtc_ids))
+
+        for crtc_id in crtc_ids:
+            stats = self.crtc(crtc_id)
+            stats.queue_depth += 1
+            stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+
+    def handle_event(self, ev: kms.DrmEvent):
+        if ev.type != kms.DrmEventType.FLIP_COMPLETE or not ev.crtc_id:
+            return
+
+        stats = self.crtc(ev.crtc_id)
+
+        time_ns = self.card.event_time_monotonic_ns(ev)
+
+        stats.add_flip(ev.seq, time_ns)
+
+        pending = self._pending.get(ev.data)
+        if pending and ev.crtc_id in pending[1]:
+            commit_ns, crtc_ids = pending
+
+            stats.add_latency(time_ns - commit_ns)
+            stats.queue_depth -= 1
+
+            crtc_ids.discard(ev.crtc_id)
+            if not crtc_ids:
+                del self._pending[ev.data]
+
+    def to_dict(self):
+        return { str(crtc_id): stats.to_dict() for crtc_id, stats in sorted(self.crtcs.items()) }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
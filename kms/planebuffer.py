@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import ctypes
+
+from typing import TYPE_CHECKING, Literal
+
+if TYPE_CHECKING:
+    from kms import Framebuffer
+
+__all__ = [ 'PlaneBuffer' ]
+
+# DLPack structs, from dlpack.h
+
+class _DLDevice(ctypes.Structure):
+    _fields_ = [
+        ('device_type', ctypes.c_int32),
+        ('device_id', ctypes.c_int32),
+    ]
+
+class _DLDataType(ctypes.Structure):
+    _fields_ = [
+        ('code', ctypes.c_uint8),
+        ('bits', ctypes.c_uint8),
+        ('lanes', ctypes.c_uint16),
+    ]
+
+class _DLTensor(ctypes.Structure):
+    _fields_ = [
+        ('data', ctypes.c_void_p),
+        ('device', _DLDevice),
+        ('ndim', ctypes.c_int32),
+        ('dtype', _DLDataType),
+        ('shape', ctypes.POINTER(ctypes.c_int64)),
+        ('strides', ctypes.POINTER(ctypes.c_int64)),
+        ('byte_offset', ctypes.c_uint64),
+    ]
+
+_DLDeleter = ctypes.CFUNCTYPE(None, ctypes.c_void_p)
+
+class _DLManagedTensor(ctypes.Structure):
+    _fields_ = [
+        ('dl_tensor', _DLTensor),
+        ('manager_ctx', ctypes.c_void_p),
+        ('deleter', _DLDeleter),
+    ]
+
+_DL_CPU = 1
+_DL_UINT = 1
+
+# The exported DLManagedTensors and what they keep alive, keyed by address
+_dlpack_exports: dict[int, tuple] = {}
+
+@_DLDeleter
+def _dlpack_deleter(addr):
+    _dlpack_exports.pop(addr, None)
+
+# Own prototypes, so that the shared ctypes.pythonapi functions are not modified.
+# The capsule destructor gets the capsule as a raw pointer. The pointer args
+# are passed as c_void_p instances, as kms.uapi's generated bindings break
+# the implicit conversion of 64 bit ints.
+_PyCapsule_New = ctypes.PYFUNCTYPE(ctypes.py_object, ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p)(
+    ('PyCapsule_New', ctypes.pythonapi))
+_PyCapsule_IsValid = ctypes.PYFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_char_p)(
+    ('PyCapsule_IsValid', ctypes.pythonapi))
+_PyCapsule_GetPointer = ctypes.PYFUNCTYPE(ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p)(
+    ('PyCapsule_GetPointer', ctypes.pythonapi))
+
+@ctypes.CFUNCTYPE(None, ctypes.c_void_p)
+def _dlpack_capsule_destructor(capsule):
+    # A consumer renames the capsule to 'used_dltensor' and calls the
+    # deleter itself. Otherwise the tensor was never used.
+    capsule = ctypes.c_void_p(capsule)
+    if _PyCapsule_IsValid(capsule, b'dltensor'):
+        _dlpack_exports.pop(_PyCapsule_GetPointer(capsule, b'dltensor'), None)
+
+# The buffer protocol formats of the element sizes
+_UINT_FORMATS: dict[int, Literal['B', 'H', 'I', 'Q']] = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+
+class PlaneBuffer:
+    """Zero-copy export of a framebuffer plane
+
+    The plane is exported with the numpy array interface, which e.g.
+    numpy.asarray() and PIL's Image.fromarray() use, with DLPack for
+    numpy.from_dlpack() and other array libraries, and with the buffer
+    protocol.
+
+    The shape is as in kms.drawing.plane_view(): (lines, pixels) with an
+    unsigned integer element for formats with one pixel per 1, 2, 4 or 8
+    byte block, otherwise, or if as_bytes is set, (lines, blocks,
+    bytes_per_block) bytes. The line stride is the plane's pitch.
+
+    The exported arrays keep the PlaneBuffer, and thus the framebuffer,
+    alive. The framebuffer is cleaned up when the last array using it is
+    gone, instead of failing to unmap a buffer still in use.
+    """
+    def __init__(self, fb: Framebuffer, plane_idx=0, as_bytes=False) -> None:
+        self.fb = fb
+        self.plane_idx = plane_idx
+
+        pi = fb.format.planes[plane_idx]
+        self.pitch = fb.planes[plane_idx].pitch
+
+        bpb = pi.bytes_per_block
+        lines = -(-fb.height // pi.vsub)
+        blocks = -(-fb.width // (pi.hsub * pi.pixels_per_block))
+
+        if pi.pixels_per_block == 1 and bpb in _UINT_FORMATS and not as_bytes:
+            self.itemsize = bpb
+            self.shape: tuple[int, ...] = (lines, blocks)
+            self.strides: tuple[int, ...] = (self.pitch, bpb)
+        else:
+            self.itemsize = 1
+            self.shape = (lines, blocks, bpb)
+            self.strides = (self.pitch, bpb, 1)
+
+        map = fb.map(plane_idx)
+
+        # Holds a buffer export of the mmap, which is released with this object
+        self._data = (ctypes.c_ubyte * len(map)).from_buffer(map)
+        self.address = ctypes.addressof(self._data)
+
+    def __del__(self):
+        # Release the mmap export before the framebuffer may be cleaned up.
+        # _data is not set if mapping the framebuffer failed.
+        if hasattr(self, '_data'):
+            del self._data
+
+    def __repr__(self) -> str:
+        return f'PlaneBuffer({self.fb}, {self.plane_idx}, shape={self.shape})'
+
+    @property
+    def __array_interface__(self):
+        return {
+            'version': 3,
+            'shape': self.shape,
+            'typestr': f'<u{self.itemsize}',
+            'data': (self.address, False),
+            'strides': self.strides,
+        }
+
+    def __dlpack_device__(self) -> tuple[int, int]:
+        return (_DL_CPU, 0)
+
+    def __dlpack__(self, stream=None, **kwargs):
+        if stream is not None:
+            raise BufferError('Only CPU streams are supported')
+
+        if self.pitch % self.itemsize:
+            raise BufferError('The pitch is not a multiple of the element size')
+
+        ndim = len(self.shape)
+
+        shape = (ctypes.c_int64 * ndim)(*self.shape)
+        # DLPack strides are in elements
+        strides = (ctypes.c_int64 * ndim)(*[s // self.itemsize for s in self.strides])
+
+        managed = _DLManagedTensor()
+        tensor = managed.dl_tensor
+        tensor.data = self.address
+        tensor.device = _DLDevice(_DL_CPU, 0)
+        tensor.ndim = ndim
+        tensor.dtype = _DLDataType(_DL_UINT, self.itemsize * 8, 1)
+        tensor.shape = shape
+        tensor.strides = strides
+        tensor.byte_offset = 0
+        managed.deleter = _dlpack_deleter
+
+        addr = ctypes.addressof(managed)
+        _dlpack_exports[addr] = (managed, shape, strides, self)
+
+        return _PyCapsule_New(ctypes.c_void_p(addr), b'dltensor',
+                              ctypes.cast(_dlpack_capsule_destructor, ctypes.c_void_p))
+
+    def memoryview(self) -> memoryview:
+        """Get the plane as a memoryview
+
+        The buffer protocol cannot skip the padding at the end of the lines,
+        so the view has shape (lines, pitch / itemsize). Like the arrays,
+        the view keeps the PlaneBuffer alive.
+        """
+        line_len = self.pitch // self.itemsize
+        nbytes = self.shape[0] * line_len * self.itemsize
+
+        # Like with the arrays, the memory is kept valid by keeping this
+        # PlaneBuffer alive, not by a buffer export of the mmap. The view
+        # references the array, and the array the PlaneBuffer.
+        data = (ctypes.c_ubyte * nbytes).from_address(self.address)
+        setattr(data, '_owner', self)
+
+        return memoryview(data).cast('B').cast(_UINT_FORMATS[self.itemsize], (self.shape[0], line_len))
+
+    def __buffer__(self, flags):
+        return self.memoryview()
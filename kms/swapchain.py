@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from collections import deque
+from enum import Enum, auto
+
+from typing import TYPE_CHECKING
+
+import kms
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'SwapchainPolicy', 'SwapchainBufferState', 'Swapchain' ]
+
+class SwapchainPolicy(Enum):
+    # Every presented frame is shown, in order
+    FIFO = auto()
+    # Only the latest presented frame is shown, older waiting frames are dropped
+    MAILBOX = auto()
+
+class SwapchainBufferState(Enum):
+    FREE = auto()       # Can be acquired
+    ACQUIRED = auto()   # Given to the user for drawing
+    READY = auto()      # Presented, waiting for the previous flip to complete
+    QUEUED = auto()     # Committed, waiting for the flip
+    SCANOUT = auto()    # On the screen
+
+class Swapchain:
+    """A set of framebuffers shown on a plane
+
+    The user acquires a free buffer with acquire(), draws into it, and
+    presents it with present(). The buffers are released when the card's
+    read_events() reports the flips, so the user only needs to keep reading
+    the events.
+
+    If present() is called while a flip is pending, the frame waits for the
+    flip to complete. With the FIFO policy all the waiting frames are shown
+    in order. With the MAILBOX policy only the latest frame is kept, and the
+    older waiting frame is dropped and its buffer released.
+    """
+    def __init__(self, card: Card, plane: kms.Plane, crtc: kms.Crtc,
+                 width: int, height: int, format: kms.PixelFormat,
+                 num_buffers=3, policy=SwapchainPolicy.FIFO,
+                 dst: tuple[int, int, int, int] | None=None) -> None:
+        self.card = card
+        self.plane = plane
+        self.crtc = crtc
+        self.policy = policy
+        self.dst = dst
+
+        self.fbs = [card.fb_pool.get(width, height, format) for _ in range(num_buffers)]
+        self._states = {fb.id: SwapchainBufferState.FREE for fb in self.fbs}
+
+        self._ready: deque[kms.Framebuffer] = deque()
+        self._queued: kms.Framebuffer | None = None
+        self._queued_token = 0
+        self._scanout: kms.Framebuffer | None = None
+
+        self._prepared_req: kms.PreparedAtomicReq | None = None
+        self._fb_id_idx = 0
+        self._damage_idx = -1
+
+        # The damage of the READY buffers, None for a full update
+        self._ready_damage: dict[int, list[tuple[int, int, int, int]] | None] = {}
+        # The damage blob of the last commit, kept alive until the next one
+        self._damage_blob: kms.Blob | None = None
+
+        self.presented_frames = 0
+        self.dropped_frames = 0
+
+        card.add_event_handler(self.handle_event, crtc)
+
+    def close(self):
+        """Stop tracking the flips and give the framebuffers back to the card's pool
+
+        The buffers which are on the screen, or queued to be, are not given
+        back, as they could be handed out while the display still uses them.
+        """
+        self.card.remove_event_handler(self.handle_event, self.crtc)
+
+        for fb in self.fbs:
+            if self._states[fb.id] not in (SwapchainBufferState.SCANOUT, SwapchainBufferState.QUEUED):
+                self.card.fb_pool.put(fb)
+
+        self.fbs = []
+
+    def state(self, fb: kms.Framebuffer) -> SwapchainBufferState:
+        return self._states[fb.id]
+
+    @property
+    def flip_pending(self):
+        return self._queued is not None
+
+    def acquire(self) -> kms.Framebuffer | None:
+        """Get a free buffer to draw into, or None if all buffers are in use"""
+        for fb in self.fbs:
+            if self._states[fb.id] == SwapchainBufferState.FREE:
+                self._states[fb.id] = SwapchainBufferState.ACQUIRED
+                return fb
+
+        return None
+
+    def present(self, fb: kms.Framebuffer, req: kms.AtomicReq | None=None, allow_modeset=False,
+                damage: list[tuple[int, int, int, int]] | None=None):
+        """Show an acquired buffer
+
+        req can be used to commit other changes, e.g. a modeset, together
+        with the first frame. It can only be given when no flip is pending.
+
+        damage is a list of (x, y, w, h) regions which differ from the
+        previously presented frame, sent as FB_DAMAGE_CLIPS. None means
+        the whole frame changed. Note that this is not the damage drawn into
+        fb, as fb's previous content is from an older frame.
+        """
+        if self._states[fb.id] != SwapchainBufferState.ACQUIRED:
+            raise RuntimeError('Buffer not acquired')
+
+        # The buffer's own damage is not used, see above
+        fb.take_damage()
+
+        if not self.presented_frames:
+            damage = None
+
+        self.presented_frames += 1
+
+        if req:
+            if self._queued or self._ready:
+                raise RuntimeError('Cannot commit a request while a flip is pending')
+
+            req.add_plane(self.plane, fb, self.crtc, dst=self.dst, damage=damage or [])
+            token = req.commit(allow_modeset=allow_modeset)
+            self._set_queued(fb, token)
+            return
+
+        if not self._queued:
+            self._commit(fb, damage)
+            return
+
+        if self.policy == SwapchainPolicy.MAILBOX:
+            while self._ready:
+                old = self._ready.popleft()
+                self._states[old.id] = SwapchainBufferState.FREE
+                self.dropped_frames += 1
+
+                # The frame is shown instead of the dropped one, so it
+                # changes also what the dropped frame changed
+                old_damage = self._ready_damage.pop(old.id)
+                if old_damage is None or damage is None:
+                    damage = None
+                else:
+                    damage = old_damage + damage
+
+        self._ready.append(fb)
+        self._ready_damage[fb.id] = damage
+        self._states[fb.id] = SwapchainBufferState.READY
+
+    def _commit(self, fb: kms.Framebuffer, damage: list[tuple[int, int, int, int]] | None):
+        prep = self._prepared_req
+
+        if not prep:
+            req = kms.AtomicReq(self.card)
+            req.add_plane(self.plane, fb, self.crtc, dst=self.dst, damage=[])
+            if 'FB_DAMAGE_CLIPS' in self.plane.prop_ids_by_name:
+                req.add(self.plane, 'FB_DAMAGE_CLIPS', 0)
+            prep = req.prepare()
+            self._prepared_req = prep
+            self._fb_id_idx = prep.index(self.plane, 'FB_ID')
+            if 'FB_DAMAGE_CLIPS' in self.plane.prop_ids_by_name:
+                self._damage_idx = prep.index(self.plane, 'FB_DAMAGE_CLIPS')
+        else:
+            prep.values[self._fb_id_idx] = fb.id
+
+        if self._damage_idx >= 0:
+            self._damage_blob = kms.AtomicReq.damage_blob(self.card, damage) if damage else None
+            prep.values[self._damage_idx] = self._damage_blob.id if self._damage_blob else 0
+
+        token = prep.commit()
+
+        self._set_queued(fb, token)
+
+    def _set_queued(self, fb: kms.Framebuffer, token: int):
+        self._queued = fb
+        self._queued_token = token
+        self._states[fb.id] = SwapchainBufferState.QUEUED
+
+    def handle_event(self, ev: kms.DrmEvent):
+        if ev.type != kms.DrmEventType.FLIP_COMPLETE:
+            return
+
+        # Ignore flips of commits done by others on the same crtc
+        if not self._queued or ev.data != self._queued_token:
+            return
+
+        if self._scanout:
+            self._states[self._scanout.id] = SwapchainBufferState.FREE
+
+        self._scanout = self._queued
+        self._states[self._scanout.id] = SwapchainBufferState.SCANOUT
+        self._queued = None
+
+        if self._ready:
+            fb = self._ready.popleft()
+            self._commit(fb, self._ready_damage.pop(fb.id))
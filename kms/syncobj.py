@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import errno
+import fcntl
+import os
+import time
+import weakref
+
+from typing import TYPE_CHECKING, Sequence
+
+import kms.uapi
+
+if TYPE_CHECKING:
+    from kms import Card
+
+__all__ = [ 'SyncObj' ]
+
+_TIMEOUT_INFINITE = 0x7fffffffffffffff
+
+def _abs_timeout(timeout_ns: int | None) -> int:
+    # The syncobj wait ioctls take an absolute CLOCK_MONOTONIC timeout
+    if timeout_ns is None:
+        return _TIMEOUT_INFINITE
+    return min(time.monotonic_ns() + timeout_ns, _TIMEOUT_INFINITE)
+
+class SyncObj:
+    """DRM sync object, binary or timeline
+
+    A binary syncobj holds a single fence. A timeline syncobj holds fences
+    for increasing points, and the methods take the point to use. Point 0
+    refers to the binary fence.
+    """
+    def __init__(self, card: Card, signaled = False, handle: int | None = None) -> None:
+        self.card = card
+
+        if handle is None:
+            create = kms.uapi.drm_syncobj_create()
+            if signaled:
+                create.flags = kms.uapi.DRM_SYNCOBJ_CREATE_SIGNALED
+            fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_CREATE, create, True)
+            self.handle: int = create.handle
+        else:
+            self.handle = handle
+
+        self._finalizer = weakref.finalize(self, SyncObj.cleanup, card, self.handle)
+
+    @staticmethod
+    def cleanup(card, handle):
+        destroy = kms.uapi.drm_syncobj_destroy()
+        destroy.handle = handle
+        fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_DESTROY, destroy, True)
+
+    def destroy(self):
+        self._finalizer()
+
+    def __repr__(self) -> str:
+        return f'SyncObj({self.handle})'
+
+    @staticmethod
+    def from_fd(card: Card, fd: int) -> SyncObj:
+        """Import a syncobj fd, e.g. one exported by another process with export_fd()"""
+        args = kms.uapi.drm_syncobj_handle()
+        args.fd = fd
+        fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_FD_TO_HANDLE, args, True)
+        return SyncObj(card, handle=args.handle)
+
+    @staticmethod
+    def from_sync_file(card: Card, fd: int) -> SyncObj:
+        """Create a binary syncobj holding the sync_file's fence"""
+        syncobj = SyncObj(card)
+        syncobj.import_sync_file(fd)
+        return syncobj
+
+    def export_fd(self) -> int:
+        """Export the syncobj as an fd. The caller owns the fd."""
+        args = kms.uapi.drm_syncobj_handle()
+        args.handle = self.handle
+        args.fd = -1
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_HANDLE_TO_FD, args, True)
+        return args.fd
+
+    def export_sync_file(self, point = 0) -> int:
+        """Export the fence at the point as a sync_file fd. The caller owns the fd."""
+        if point:
+            # Only the binary fence can be exported, so move the point's fence to a binary syncobj
+            tmp = SyncObj(self.card)
+            self.transfer(tmp, src_point=point)
+            return tmp.export_sync_file()
+
+        args = kms.uapi.drm_syncobj_handle()
+        args.handle = self.handle
+        args.flags = kms.uapi.DRM_SYNCOBJ_HANDLE_TO_FD_FLAGS_EXPORT_SYNC_FILE
+        args.fd = -1
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_HANDLE_TO_FD, args, True)
+        return args.fd
+
+    def import_sync_file(self, fd: int, point = 0):
+        """Replace the fence at the point with the sync_file's fence. The fd is not closed."""
+        if point:
+            tmp = SyncObj.from_sync_file(self.card, fd)
+            tmp.transfer(self, dst_point=point)
+            return
+
+        args = kms.uapi.drm_syncobj_handle()
+        args.handle = self.handle
+        args.flags = kms.uapi.DRM_SYNCOBJ_FD_TO_HANDLE_FLAGS_IMPORT_SYNC_FILE
+        args.fd = fd
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_FD_TO_HANDLE, args, True)
+
+    def transfer(self, dst: SyncObj, src_point = 0, dst_point = 0, flags = 0):
+        """Copy the fence at src_point to dst_point of dst"""
+        args = kms.uapi.drm_syncobj_transfer()
+        args.src_handle = self.handle
+        args.dst_handle = dst.handle
+        args.src_point = src_point
+        args.dst_point = dst_point
+        args.flags = flags
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_TRANSFER, args, True)
+
+    def reset(self):
+        """Remove the binary fence, making the syncobj unsignaled"""
+        handles = ctypes.c_uint32(self.handle)
+
+        args = kms.uapi.drm_syncobj_array()
+        args.handles = ctypes.addressof(handles)
+        args.count_handles = 1
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_RESET, args, True)
+
+    def signal(self, point = 0):
+        """Signal the binary fence, or the timeline point"""
+        handles = ctypes.c_uint32(self.handle)
+
+        if point:
+            points = ctypes.c_uint64(point)
+
+            args = kms.uapi.drm_syncobj_timeline_array()
+            args.handles = ctypes.addressof(handles)
+            args.points = ctypes.addressof(points)
+            args.count_handles = 1
+            fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_TIMELINE_SIGNAL, args, True)
+        else:
+            args = kms.uapi.drm_syncobj_array()
+            args.handles = ctypes.addressof(handles)
+            args.count_handles = 1
+            fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_SIGNAL, args, True)
+
+    def query(self, last_submitted = False) -> int:
+        """Get the timeline's last signaled point, or the last submitted one"""
+        handles = ctypes.c_uint32(self.handle)
+        points = ctypes.c_uint64(0)
+
+        args = kms.uapi.drm_syncobj_timeline_array()
+        args.handles = ctypes.addressof(handles)
+        args.points = ctypes.addressof(points)
+        args.count_handles = 1
+        if last_submitted:
+            args.flags = kms.uapi.DRM_SYNCOBJ_QUERY_FLAGS_LAST_SUBMITTED
+        fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_QUERY, args, True)
+
+        return points.value
+
+    def wait(self, point = 0, timeout_ns: int | None = None, wait_for_submit = False) -> bool:
+        """Wait for the fence at the point. Returns False on timeout."""
+        return SyncObj.wait_many([self], [point], timeout_ns, wait_all=True,
+                                 wait_for_submit=wait_for_submit) is not None
+
+    @staticmethod
+    def wait_many(syncobjs: Sequence[SyncObj], points: Sequence[int] | None = None,
+                  timeout_ns: int | None = None, wait_all = True,
+                  wait_for_submit = False) -> int | None:
+        """Wait for the fences of multiple syncobjs of the same card
+
+        timeout_ns is relative, None waits forever and 0 only polls. Returns
+        None on timeout. Otherwise, if wait_all is False, returns the index
+        of the first signaled syncobj, and if wait_all is True returns 0.
+        """
+        card = syncobjs[0].card
+        count = len(syncobjs)
+
+        handles = (ctypes.c_uint32 * count)(*[s.handle for s in syncobjs])
+
+        flags = 0
+        if wait_all:
+            flags |= kms.uapi.DRM_SYNCOBJ_WAIT_FLAGS_WAIT_ALL
+        if wait_for_submit:
+            flags |= kms.uapi.DRM_SYNCOBJ_WAIT_FLAGS_WAIT_FOR_SUBMIT
+
+        try:
+            if points and any(points):
+                points_arr = (ctypes.c_uint64 * count)(*points)
+
+                twait = kms.uapi.drm_syncobj_timeline_wait()
+                twait.handles = ctypes.addressof(handles)
+                twait.points = ctypes.addressof(points_arr)
+                twait.timeout_nsec = _abs_timeout(timeout_ns)
+                twait.count_handles = count
+                twait.flags = flags
+                fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_TIMELINE_WAIT, twait, True)
+                first_signaled = twait.first_signaled
+            else:
+                wait = kms.uapi.drm_syncobj_wait()
+                wait.handles = ctypes.addressof(handles)
+                wait.timeout_nsec = _abs_timeout(timeout_ns)
+                wait.count_handles = count
+                wait.flags = flags
+                fcntl.ioctl(card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_WAIT, wait, True)
+                first_signaled = wait.first_signaled
+        except OSError as e:
+            if e.errno != errno.ETIME:
+                raise
+            return None
+
+        return 0 if wait_all else first_signaled
+
+    def eventfd(self, point = 0, wait_available = False) -> int:
+        """Get an eventfd which becomes readable when the fence at the point signals
+
+        With wait_available, the eventfd is signaled when the fence is
+        submitted instead. Needs DRM_IOCTL_SYNCOBJ_EVENTFD (Linux 6.6) and
+        os.eventfd() (Python 3.10). The caller owns the fd.
+        """
+        if not hasattr(os, 'eventfd'):
+            raise NotImplementedError('eventfd is not supported')
+
+        efd = os.eventfd(0, os.EFD_CLOEXEC | os.EFD_NONBLOCK)
+
+        args = kms.uapi.drm_syncobj_eventfd()
+        args.handle = self.handle
+        args.point = point
+        args.fd = efd
+        if wait_available:
+            args.flags = kms.uapi.DRM_SYNCOBJ_WAIT_FLAGS_WAIT_AVAILABLE
+
+        try:
+            fcntl.ioctl(self.card.fd, kms.uapi.DRM_IOCTL_SYNCOBJ_EVENTFD, args, True)
+        except OSError:
+            os.close(efd)
+            raise
+
+        return efd
+
+    async def wait_async(self, point = 0, wait_available = False):
+        """Wait for the fence at the point without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        efd = self.eventfd(point, wait_available)
+
+        def readable():
+            if not fut.done():
+                fut.set_result(None)
+
+        loop.add_reader(efd, readable)
+
+        try:
+            await fut
+        finally:
+            loop.remove_reader(efd)
+            os.close(efd)
@@ -1,3 +1,5 @@
+import ctypes
+
 from .kms import *
 
 DRM_MODE_CONNECTED         = 1
@@ -7,3 +9,17 @@ DRM_MODE_UNKNOWNCONNECTION = 3
 DRM_PLANE_TYPE_OVERLAY = 0
 DRM_PLANE_TYPE_PRIMARY = 1
 DRM_PLANE_TYPE_CURSOR  = 2
+
+# Not yet in the generated headers
+DRM_CAP_ATOMIC_ASYNC_PAGE_FLIP = 0x15
+
+class drm_syncobj_eventfd(ctypes.Structure):
+    _fields_ = [
+        ('handle', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('point', ctypes.c_uint64),
+        ('fd', ctypes.c_int32),
+        ('pad', ctypes.c_uint32),
+    ]
+
+DRM_IOCTL_SYNCOBJ_EVENTFD = DRM_IOWR(0xCF, drm_syncobj_eventfd)
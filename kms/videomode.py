@@ -16,8 +16,18 @@ class VideoMode:
     def __repr__(self):
         return f'VideoMode({self.modeinfo.hdisplay}x{self.modeinfo.vdisplay})'
 
+    TIMING_FIELDS = ('clock',
+                     'hdisplay', 'hsync_start', 'hsync_end', 'htotal', 'hskew',
+                     'vdisplay', 'vsync_start', 'vsync_end', 'vtotal', 'vscan',
+                     'flags')
+
+    def matches(self, other: VideoMode):
+        """Check if the modes have identical timings, ignoring name and type"""
+        return all(getattr(self.modeinfo, f) == getattr(other.modeinfo, f)
+                   for f in VideoMode.TIMING_FIELDS)
+
     def to_blob(self, card: Card):
-        return kms.Blob(card, self.modeinfo)
+        return card.blob_cache.get(self.modeinfo)
 
     @property
     def clock(self):
@@ -42,3 +52,14 @@ class VideoMode:
     @property
     def interlace(self):
         return self.modeinfo.flags & kms.uapi.DRM_MODE_FLAG_INTERLACE
+
+    @property
+    def frame_period_ns(self) -> int:
+        """Time between vblanks, computed as the kernel does for vblank timestamps"""
+        if not self.modeinfo.clock:
+            raise ValueError('The mode has no pixel clock')
+        period = self.modeinfo.htotal * self.modeinfo.vtotal * 1000000 // self.modeinfo.clock
+        # Interlaced modes have a vblank per field
+        if self.interlace:
+            period //= 2
+        return period
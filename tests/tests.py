@@ -1,10 +1,13 @@
 #!/usr/bin/python3
 
+import ctypes
 import fcntl
 import gc
+import struct
 import unittest
 
 import kms
+import kms.uapi
 
 
 class TestCardMethods(unittest.TestCase):
@@ -28,6 +31,26 @@ class TestCardMethods(unittest.TestCase):
         with self.assertRaises(Exception):
             fcntl.fcntl(fd, fcntl.F_GETFD)
 
+    def test_card_lazy(self):
+        card = self._get_card()
+        lazy_card = kms.Card(card.dev_path, lazy=True)
+
+        self.assertEqual([c.id for c in card.crtcs], [c.id for c in lazy_card.crtcs])
+        self.assertEqual([c.id for c in card.connectors], [c.id for c in lazy_card.connectors])
+        self.assertEqual([p.id for p in card.planes], [p.id for p in lazy_card.planes])
+
+        for p, lazy_p in zip(card.planes, lazy_card.planes):
+            self.assertEqual(p.prop_values, lazy_p.prop_values)
+            self.assertEqual(p.plane_type, lazy_p.plane_type)
+
+    def test_prop_ids_by_name(self):
+        card = self._get_card()
+
+        for ob in [*card.crtcs, *card.connectors, *card.planes]:
+            for name, prop_id in ob.prop_ids_by_name.items():
+                self.assertEqual(card.find_property_name(prop_id), name)
+                self.assertEqual(ob.get_prop_ids(name)[0], prop_id)
+
     def test_card_fb_2(self):
         card = self._get_card()
         fd = card.fd
@@ -48,6 +71,75 @@ class TestCardMethods(unittest.TestCase):
             fcntl.fcntl(fb_fd, fcntl.F_GETFD)
         self.assertTrue(map.closed)
 
+    def test_fb_pool(self):
+        card = self._get_card()
+
+        pool = kms.FramebufferPool(card, max_bytes=640 * 480 * 4)
+
+        with self.assertRaises(ValueError):
+            pool.get(640, 480, kms.PixelFormats.XRGB8888, modifier=1)
+
+        fb1 = pool.get(640, 480, kms.PixelFormats.XRGB8888)
+        fb2 = pool.get(640, 480, kms.PixelFormats.XRGB8888)
+        fb2.add_damage(0, 0, 16, 16)
+        pool.put(fb1)
+        pool.put(fb2)
+
+        # Only one fits in the budget, the least recently returned is evicted
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.evictions, 1)
+
+        # The damage of the previous user is dropped
+        self.assertIs(pool.get(640, 480, kms.PixelFormats.XRGB8888), fb2)
+        self.assertEqual(fb2.damage, [])
+        self.assertEqual(pool.hits, 1)
+        self.assertEqual(pool.misses, 2)
+
+    def test_commit_queue_merge(self):
+        card = self._get_card()
+        crtc1 = card.crtcs[0]
+        crtc2 = card.crtcs[-1]
+
+        queue = kms.CommitQueue(card, crtc1, kms.CommitQueuePolicy.MERGE)
+
+        req1 = kms.AtomicReq(card)
+        req1.add_out_fence(crtc1)
+        req2 = kms.AtomicReq(card)
+        req2.add_out_fence(crtc2)
+
+        req = queue._merge(req1, req2)
+
+        self.assertEqual(req._out_fences, {**req1._out_fences, **req2._out_fences})
+
+        # The OUT_FENCE_PTRs point to the kept fences
+        for ob_id, prop_id, value in req.props:
+            self.assertEqual(card.find_property_name(prop_id), 'OUT_FENCE_PTR')
+            self.assertEqual(value, ctypes.addressof(req._out_fences[ob_id]))
+
+
+class TestDrmEvents(unittest.TestCase):
+    def test_decode_events(self):
+        buf = bytearray()
+        # struct drm_event_vblank
+        buf += struct.pack('=IIQIIII', kms.uapi.DRM_EVENT_FLIP_COMPLETE, 32, 5, 2, 500, 100, 31)
+        # An unknown event, e.g. a driver specific one
+        buf += struct.pack('=IIQ', 0x80000000, 16, 0)
+        # struct drm_event_crtc_sequence
+        buf += struct.pack('=IIQqQ', kms.uapi.DRM_EVENT_CRTC_SEQUENCE, 32, 6, 3000000000, 200)
+
+        events: list[kms.DrmEvent] = []
+        kms.decode_events(buf, len(buf), events)
+
+        self.assertEqual(events, [
+            kms.DrmEvent(kms.DrmEventType.FLIP_COMPLETE, 100, 2000500000, 5, 31),
+            kms.DrmEvent(kms.DrmEventType.CRTC_SEQUENCE, 200, 3000000000, 6, 0),
+        ])
+
+        # Only the given length is decoded
+        events = []
+        kms.decode_events(buf, 32, events)
+        self.assertEqual(len(events), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
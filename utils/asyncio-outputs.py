@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+# Flip between two colors on one or more outputs, each driven by its own
+# asyncio task.
+
+import argparse
+import asyncio
+import sys
+
+import kms
+import kms.drawing
+
+async def run_output(card: kms.Card, conn: kms.Connector, crtc: kms.Crtc, plane: kms.Plane,
+                     num_frames: int):
+    mode = conn.get_default_mode()
+
+    fbs = []
+    for color in (0xff0000, 0x0000ff):
+        fb = kms.DumbFramebuffer(card, mode.hdisplay, mode.vdisplay, kms.PixelFormats.XRGB8888)
+        kms.drawing.NumpyFramebuffer(fb).fill_rect(0, 0, fb.width, fb.height, color)
+        fbs.append(fb)
+
+    req = kms.AtomicReq(card)
+    modeset = req.add_mode(conn, crtc, mode)
+    req.add_plane(plane, fbs[0], crtc, dst=(0, 0, mode.hdisplay, mode.vdisplay))
+    await req.commit_async(allow_modeset = modeset)
+
+    for i in range(num_frames):
+        req = kms.AtomicReq(card)
+        req.add(plane, 'FB_ID', fbs[i % 2].id)
+        events = await req.commit_async()
+
+        if i % 60 == 0:
+            print(f'{conn.fullname}: {events[0]}')
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--connector', action='append', default=[])
+    parser.add_argument('-n', '--frames', type=int, default=600)
+    args = parser.parse_args()
+
+    card = kms.Card()
+    res = kms.ResourceManager(card)
+
+    tasks = []
+    for name in args.connector or ['']:
+        conn = res.reserve_connector(name)
+        crtc = res.reserve_crtc(conn)
+        # A plane of its own, as planes may be usable on any crtc
+        plane = res.reserve_plane(crtc, kms.PixelFormats.XRGB8888)
+        tasks.append(run_output(card, conn, crtc, plane, args.frames))
+
+    await asyncio.gather(*tasks)
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+# Compare the cost of building an AtomicReq for every frame against patching
+# the values of a PreparedAtomicReq. The commits are done with TEST_ONLY, so
+# the results are not limited by the display refresh rate.
+
+import argparse
+import sys
+import time
+
+import kms
+
+def run(name, func, num_iters):
+    ts1 = time.perf_counter()
+
+    for i in range(num_iters):
+        func(i)
+
+    ts2 = time.perf_counter()
+
+    print(f'{name}: {(ts2 - ts1) / num_iters * 1000000:.2f} us per commit')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--connector', default='')
+    parser.add_argument('-p', '--planes', type=int, default=1, help='number of planes to update per commit')
+    parser.add_argument('-n', '--iters', type=int, default=10000)
+    args = parser.parse_args()
+
+    card = kms.Card()
+
+    res = kms.ResourceManager(card)
+    conn = res.reserve_connector(args.connector)
+    crtc = res.reserve_crtc(conn)
+    mode = conn.get_default_mode()
+
+    planes = []
+    for _ in range(args.planes):
+        planes.append(res.reserve_plane(crtc, kms.PixelFormats.XRGB8888))
+
+    w = mode.hdisplay // 4
+    h = mode.vdisplay // 4
+
+    fbs = [kms.DumbFramebuffer(card, w, h, kms.PixelFormats.XRGB8888) for _ in range(2)]
+
+    modeb = mode.to_blob(card)
+
+    req = kms.AtomicReq(card)
+    req.add_connector(conn, crtc)
+    req.add_crtc(crtc, modeb)
+    for idx, plane in enumerate(planes):
+        req.add_plane(plane, fbs[0], crtc, dst=(idx * w, 0, w, h))
+    req.commit_sync(allow_modeset = True)
+
+    def commit_dynamic(i):
+        fb = fbs[i % 2]
+        req = kms.AtomicReq(card)
+        for idx, plane in enumerate(planes):
+            req.add_plane(plane, fb, crtc, dst=(idx * w, 0, w, h))
+        req.test(use_cache=False)
+
+    req = kms.AtomicReq(card)
+    for idx, plane in enumerate(planes):
+        req.add_plane(plane, fbs[0], crtc, dst=(idx * w, 0, w, h))
+    prep = req.prepare()
+
+    fb_id_indices = [prep.index(plane, 'FB_ID') for plane in planes]
+    values = prep.values
+
+    def commit_prepared(i):
+        fb_id = fbs[i % 2].id
+        for idx in fb_id_indices:
+            values[idx] = fb_id
+        prep.test(use_cache=False)
+
+    def commit_cached(i):
+        fb = fbs[i % 2]
+        req = kms.AtomicReq(card)
+        for idx, plane in enumerate(planes):
+            req.add_plane(plane, fb, crtc, dst=(idx * w, 0, w, h))
+        req.test()
+
+    run('AtomicReq', commit_dynamic, args.iters)
+    run('PreparedAtomicReq', commit_prepared, args.iters)
+    run('AtomicReq, cached test', commit_cached, args.iters)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,17 +12,16 @@ class FlipHandler:
     def __init__(self):
         super().__init__()
         self.bar_xpos = 0
-        self.front_buf = 0
-        self.fb1 = kms.DumbFramebuffer(card, mode.hdisplay, mode.vdisplay, kms.PixelFormats.XRGB8888)
-        self.fb2 = kms.DumbFramebuffer(card, mode.hdisplay, mode.vdisplay, kms.PixelFormats.XRGB8888)
+        self.swapchain = kms.Swapchain(card, crtc.primary_plane, crtc,
+                                       mode.hdisplay, mode.vdisplay, kms.PixelFormats.XRGB8888,
+                                       num_buffers=2)
         self.flips = 0
         self.frames = 0
         self.time = 0
 
-        self.nfb1 = kms.drawing.NumpyFramebuffer(self.fb1, prepopulate=True)
-        self.nfb2 = kms.drawing.NumpyFramebuffer(self.fb2, prepopulate=True)
+        self.nfbs = {fb.id: kms.drawing.NumpyFramebuffer(fb, prepopulate=True) for fb in self.swapchain.fbs}
 
-    def handle_page_flip(self, frame, time):
+    def handle_page_flip(self, frame, time, req=None):
         self.flips += 1
         if self.time == 0:
             self.frames = frame
@@ -38,14 +37,12 @@ class FlipHandler:
             self.frames = frame
             self.time = time
 
-        if self.front_buf == 0:
-            fb = self.fb2
-            nfb = self.nfb2
-        else:
-            fb = self.fb1
-            nfb = self.nfb1
+        fb = self.swapchain.acquire()
+        if not fb:
+            # All the buffers are in use, skip the frame
+            return
 
-        self.front_buf = self.front_buf ^ 1
+        nfb = self.nfbs[fb.id]
 
         current_xpos = self.bar_xpos
         old_xpos = (current_xpos + (fb.width - bar_width - bar_speed)) % (fb.width - bar_width)
@@ -55,9 +52,13 @@ class FlipHandler:
 
         nfb.draw_color_bar(old_xpos, new_xpos, bar_width)
 
-        ctx = kms.AtomicReq(card)
-        ctx.add(crtc.primary_plane, 'FB_ID', fb.id)
-        ctx.commit()
+        # Compared to the previous frame, the bar moved from current_xpos
+        damage = [(current_xpos, 0, bar_width, fb.height), (new_xpos, 0, bar_width, fb.height)]
+
+        if req:
+            self.swapchain.present(fb, req, allow_modeset=True)
+        else:
+            self.swapchain.present(fb, damage=damage)
 
 if len(sys.argv) > 1:
     conn_name = sys.argv[1]
@@ -65,6 +66,7 @@ else:
     conn_name = ''
 
 card = kms.Card()
+pacing_stats = card.enable_pacing_stats()
 res = kms.ResourceManager(card)
 conn = res.reserve_connector(conn_name)
 crtc = res.reserve_crtc(conn)
@@ -72,11 +74,13 @@ mode = conn.get_default_mode()
 
 fliphandler = FlipHandler()
 
-kms.AtomicReq.set_mode(conn, crtc, fliphandler.fb1, mode)
+req = kms.AtomicReq(card)
+modeset = req.add_mode(conn, crtc, mode)
 
-fliphandler.handle_page_flip(0, 0)
+fliphandler.handle_page_flip(0, 0, req if modeset else None)
 
 def readdrm():
+    # The swapchain is updated by read_events()
     for ev in card.read_events():
         if ev.type == kms.DrmEventType.FLIP_COMPLETE:
             fliphandler.handle_page_flip(ev.seq, ev.time)
@@ -85,6 +89,7 @@ def readdrm():
 def readkey():
     #print("KEY EVENT")
     sys.stdin.readline()
+    print(pacing_stats.to_json(indent=4))
     sys.exit(0)
 
 sel = selectors.DefaultSelector()
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+# Measure how many DRM events per second can be decoded. The events are
+# synthetic flip events in a buffer, so no card is needed. The decoder used
+# by kms.Card.read_events() is compared against overlaying ctypes structures
+# on the buffer.
+
+import argparse
+import ctypes
+import struct
+import sys
+import time
+
+import kms
+import kms.uapi
+from kms.drmevent import decode_events
+
+def decode_events_ctypes(buf, length, events):
+    i = 0
+    while i < length:
+        ev = kms.uapi.drm_event.from_buffer(buf, i)
+
+        if ev.type == kms.uapi.DRM_EVENT_FLIP_COMPLETE:
+            vblank = kms.uapi.drm_event_vblank.from_buffer(buf, i)
+            time_ns = vblank.tv_sec * 1000000000 + vblank.tv_usec * 1000
+            events.append(kms.DrmEvent(kms.DrmEventType.FLIP_COMPLETE, vblank.sequence, time_ns,
+                                       vblank.user_data, vblank.crtc_id))
+
+        i += ev.length
+
+def run(name, func, buf, num_events, num_iters):
+    events = []
+
+    ts1 = time.perf_counter()
+
+    for _ in range(num_iters):
+        events = []
+        func(buf, len(buf), events)
+
+    ts2 = time.perf_counter()
+
+    assert not num_iters or len(events) == num_events
+
+    print(f'{name}: {num_events * num_iters / (ts2 - ts1) / 1000000:.2f} M events/s')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--events', type=int, default=32, help='number of events per read')
+    parser.add_argument('-n', '--iters', type=int, default=10000)
+    args = parser.parse_args()
+
+    ev_size = ctypes.sizeof(kms.uapi.drm_event_vblank)
+
+    buf = bytearray()
+    for i in range(args.events):
+        buf += struct.pack('=IIQIIII', kms.uapi.DRM_EVENT_FLIP_COMPLETE, ev_size,
+                           i, 1000 + i, i * 16666 % 1000000, i, 31 + i % 4)
+
+    run('ctypes', decode_events_ctypes, buf, args.events, args.iters)
+    run('struct', decode_events, buf, args.events, args.iters)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -53,8 +53,6 @@ def main():
 
     print(mode)
 
-    modeb = mode.to_blob(card)
-
     fmt = kms.PixelFormats.find_by_name(args.format)
 
     width = mode.hdisplay
@@ -82,11 +80,13 @@ def main():
 
     req = kms.AtomicReq(card)
 
-    req.add_connector(conn, crtc)
-    req.add_crtc(crtc, modeb)
+    modeset = req.add_mode(conn, crtc, mode)
     req.add_plane(plane, fb, crtc, dst=(0, 0, width, height))
 
-    req.commit_sync(allow_modeset = True)
+    req.commit_sync(allow_modeset = modeset)
+
+    if not modeset:
+        print('Mode already set, modeset skipped')
 
     input('press enter to exit\n')
 
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+# Move a bar with a kms.FrameScheduler. The bar position is computed from
+# the predicted vblank time, and the frame is drawn as late as possible
+# before the vblank.
+
+import argparse
+import asyncio
+import sys
+
+import kms
+import kms.drawing
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--connector', default='')
+    parser.add_argument('-n', '--frames', type=int, default=600)
+    parser.add_argument('--margin', type=float, default=1.0, help='minimum safety margin in ms')
+    args = parser.parse_args()
+
+    card = kms.Card()
+
+    res = kms.ResourceManager(card)
+    conn = res.reserve_connector(args.connector)
+    crtc = res.reserve_crtc(conn)
+    plane = res.reserve_plane(crtc, kms.PixelFormats.XRGB8888)
+    mode = conn.get_default_mode()
+
+    fbs = [kms.DumbFramebuffer(card, mode.hdisplay, mode.vdisplay, kms.PixelFormats.XRGB8888)
+           for _ in range(2)]
+    views = [kms.drawing.NumpyFramebuffer(fb) for fb in fbs]
+
+    req = kms.AtomicReq(card)
+    modeset = req.add_mode(conn, crtc, mode)
+    req.add_plane(plane, fbs[0], crtc, dst=(0, 0, mode.hdisplay, mode.vdisplay))
+    await req.commit_async(allow_modeset = modeset)
+
+    prep = kms.AtomicReq(card)
+    prep.add(plane, 'FB_ID', fbs[0].id)
+    prep = prep.prepare()
+    fb_id_idx = prep.index(plane, 'FB_ID')
+
+    bar_w = 20
+    # One screen width per second
+    speed = mode.hdisplay / 1000000000
+
+    state = { 'frame': 0 }
+    # The bar position last drawn in each fb
+    old_xs = [0, 0]
+
+    def render(target_ns: int):
+        i = state['frame'] = state['frame'] + 1
+        fb = fbs[i % 2]
+        view = views[i % 2]
+
+        x = int(target_ns * speed) % (mode.hdisplay - bar_w)
+
+        view.fill_rect(old_xs[i % 2], 0, bar_w, fb.height, 0)
+        view.fill_rect(x, 0, bar_w, fb.height, 0xffffff)
+        old_xs[i % 2] = x
+
+        prep.values[fb_id_idx] = fb.id
+        return prep
+
+    sched = kms.FrameScheduler(card, crtc, render, min_margin_ns=int(args.margin * 1000000),
+                               mode=mode)
+
+    for _ in range(args.frames // 60):
+        await sched.run(num_frames=sched.frames + 60)
+        print(sched.stats())
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
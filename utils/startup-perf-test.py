@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+# Count the ioctls done when opening a card, and when doing a typical
+# "find a connector, crtc and plane" setup, in eager and lazy modes.
+
+import argparse
+import collections
+import fcntl
+import sys
+import time
+
+import kms
+import kms.uapi
+
+ioctl_names = {getattr(kms.uapi, n): n for n in dir(kms.uapi) if n.startswith('DRM_IOCTL_')}
+
+ioctl_counts: collections.Counter = collections.Counter()
+
+orig_ioctl = fcntl.ioctl
+
+def counting_ioctl(fd, request, *args):
+    ioctl_counts[ioctl_names.get(request, hex(request))] += 1
+    return orig_ioctl(fd, request, *args)
+
+def run(lazy: bool, connector: str, verbose: bool):
+    ioctl_counts.clear()
+
+    ts1 = time.perf_counter()
+
+    card = kms.Card(lazy=lazy)
+
+    ts2 = time.perf_counter()
+    num_init = sum(ioctl_counts.values())
+
+    res = kms.ResourceManager(card)
+    conn = res.reserve_connector(connector)
+    crtc = res.reserve_crtc(conn)
+    res.reserve_plane(crtc, kms.PixelFormats.XRGB8888)
+
+    ts3 = time.perf_counter()
+    num_total = sum(ioctl_counts.values())
+
+    print(f'{"lazy" if lazy else "eager"}: init {num_init} ioctls {(ts2 - ts1) * 1000:.2f} ms, ' +
+          f'init+setup {num_total} ioctls {(ts3 - ts1) * 1000:.2f} ms')
+
+    if verbose:
+        for name, count in ioctl_counts.most_common():
+            print(f'    {name}: {count}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--connector', default='')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    fcntl.ioctl = counting_ioctl
+
+    run(False, args.connector, args.verbose)
+    run(True, args.connector, args.verbose)
+
+if __name__ == '__main__':
+    sys.exit(main())